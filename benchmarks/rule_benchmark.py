@@ -0,0 +1,145 @@
+import datetime
+import glob
+import json
+import os
+import statistics
+import time
+from db_client.db_client import get_connection
+from data_handler.repository import get_email_repository
+from logger.logger import get_logger
+
+logger = get_logger(__name__,"logs/rule_benchmark")
+
+DEFAULT_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules")
+
+
+def rule_files(path):
+    """A single rules file, or every *.json file of a catalogue directory."""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.json")))
+    return [path]
+
+
+def _plan_nodes(plan):
+    """Node types of an EXPLAIN (FORMAT JSON) plan, depth first."""
+    nodes = [plan["Node Type"]]
+    for child in plan.get("Plans", []):
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _time_postgres(repository, rules, predicate, repeat, explain):
+    """Time the compiled rule query on one held connection and capture its plan."""
+    compiled = repository.build_conditions_query(rules, predicate)
+    if compiled is None:
+        return [], 0, None
+    query, params = compiled
+
+    timings = []
+    rows = 0
+    plan = None
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cur.execute(query, params)
+                rows = len(cur.fetchall())
+                timings.append((time.perf_counter() - started) * 1000)
+            if explain:
+                cur.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params)
+                plan = cur.fetchone()[0]
+                plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]
+        conn.rollback()
+    finally:
+        conn.close()
+    return timings, rows, plan
+
+
+def _table_estimate():
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass('emails');")
+            row = cur.fetchone()
+            return row[0] if row else None
+    finally:
+        conn.close()
+
+
+def run_benchmarks(path=DEFAULT_CATALOG, repeat=5, explain=True):
+    """
+    Run every rules file under `path` `repeat` times and return one result
+    per file with latency statistics (ms), rows returned and, on Postgres,
+    the EXPLAIN ANALYZE plan of the compiled query.
+    """
+    repository = get_email_repository()
+    on_postgres = hasattr(repository, "build_conditions_query")
+    results = []
+    for rules_file in rule_files(path):
+        with open(rules_file, 'r') as f:
+            rules_data = json.load(f)
+        rules = rules_data.get("rules", [])
+        predicate = rules_data.get("predicate", "All")
+
+        if on_postgres:
+            timings, rows, plan = _time_postgres(repository, rules, predicate, repeat, explain)
+        else:
+            timings, rows, plan = [], 0, None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = len(repository.get_emails_by_conditions(rules, predicate))
+                timings.append((time.perf_counter() - started) * 1000)
+
+        result = {
+            "name": os.path.splitext(os.path.basename(rules_file))[0],
+            "rules_file": rules_file,
+            "rows": rows,
+            "runs": len(timings),
+        }
+        if timings:
+            result.update({
+                "min_ms": round(min(timings), 3),
+                "median_ms": round(statistics.median(timings), 3),
+                "p95_ms": round(_percentile(timings, 0.95), 3),
+                "max_ms": round(max(timings), 3),
+            })
+        if plan:
+            nodes = _plan_nodes(plan["Plan"])
+            result.update({
+                "plan_nodes": nodes,
+                "seq_scan": any(node == "Seq Scan" for node in nodes),
+                "execution_ms": plan.get("Execution Time"),
+                "plan": plan,
+            })
+        logger.info(f"[run_benchmarks] {result['name']}: {rows} rows, median {result.get('median_ms')} ms")
+        results.append(result)
+    return results
+
+
+def write_report(results, output):
+    """Write the results with run metadata to `output` as JSON."""
+    report = {
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "table_rows_estimate": _table_estimate() if any("plan" in r for r in results) else None,
+        "results": results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    return report
+
+
+def format_summary(results):
+    """One line per rules file, for the terminal."""
+    lines = [f"{'rules':<24}{'rows':>10}{'median ms':>12}{'p95 ms':>10}  plan"]
+    for r in results:
+        plan = " > ".join(r.get("plan_nodes", [])) or "-"
+        lines.append(
+            f"{r['name']:<24}{r['rows']:>10}{r.get('median_ms', 0):>12.2f}{r.get('p95_ms', 0):>10.2f}  {plan}"
+        )
+    return "\n".join(lines)
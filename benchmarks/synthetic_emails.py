@@ -0,0 +1,187 @@
+import csv
+import datetime
+import io
+import itertools
+import random
+import time
+import uuid
+from db_client.db_client import emails_partitioned, ensure_partitions, get_connection
+from logger.logger import get_logger
+
+logger = get_logger(__name__,"logs/synthetic_emails")
+
+# Gmail system labels plus a few user labels, with the share of mail carrying each
+LABEL_SHARES = [
+    ('INBOX', 'INBOX', 0.70),
+    ('UNREAD', 'UNREAD', 0.30),
+    ('IMPORTANT', 'IMPORTANT', 0.15),
+    ('STARRED', 'STARRED', 0.03),
+    ('CATEGORY_PROMOTIONS', 'CATEGORY_PROMOTIONS', 0.25),
+    ('CATEGORY_UPDATES', 'CATEGORY_UPDATES', 0.20),
+    ('CATEGORY_SOCIAL', 'CATEGORY_SOCIAL', 0.08),
+    ('Label_1', 'ArchiveMail', 0.10),
+    ('Label_2', 'Receipts', 0.05),
+    ('Label_3', 'Work', 0.12),
+]
+
+SUBJECT_TEMPLATES = [
+    "Your order #{number} has shipped",
+    "Invoice {number} from {company}",
+    "Weekly digest: {topic}",
+    "Re: {topic}",
+    "Fwd: {topic} notes",
+    "[{project}] Build {status} on main",
+    "Meeting: {topic} on {day}",
+    "Your {company} receipt",
+    "Security alert for your {company} account",
+    "{company} newsletter - {month} edition",
+    "Support ticket #{number}: {topic}",
+    "Reminder: {topic} due {day}",
+]
+
+SNIPPET_TEMPLATES = [
+    "Hi, just following up on {topic}. Let me know what you think.",
+    "Thanks for your purchase from {company}. Your receipt is attached.",
+    "Here is what happened in {topic} this week.",
+    "The build for {project} finished with status {status}.",
+    "Please review the attached document before {day}.",
+]
+
+WORDS = {
+    'company': ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark", "Wayne", "Wonka", "Tyrell", "Cyberdyne"],
+    'topic': ["quarterly planning", "the release", "budget review", "onboarding", "the migration",
+              "customer feedback", "hiring", "the roadmap", "incident 42", "team offsite"],
+    'project': ["api", "web", "billing", "search", "mobile", "infra"],
+    'status': ["passed", "failed", "fixed", "cancelled"],
+    'day': ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"],
+    'month': ["January", "February", "March", "April", "May", "June", "July",
+              "August", "September", "October", "November", "December"],
+}
+
+FIRST_NAMES = ["alex", "sam", "jordan", "taylor", "morgan", "casey", "riley", "jamie", "drew", "quinn"]
+ROLES = ["noreply", "support", "billing", "alerts", "news", "team", "info", "updates"]
+
+COPY_COLUMNS = (
+    "gmail_id", "thread_id", "sender", "sender_email", "sender_domain", "subject",
+    "messages", "date_received", "is_read", "labels", "label_ids",
+)
+
+
+def _fill(template, rng):
+    return template.format(number=rng.randint(10000, 999999),
+                           **{key: rng.choice(values) for key, values in WORDS.items()})
+
+
+def _build_senders(sender_count, domain_count):
+    """
+    A pool of (header, address, domain) tuples, ordered by popularity rank.
+    Sender i belongs to domain i % domain_count, so domain traffic inherits
+    the sender skew; sender 0 is always noreply0@acme0.com so rule catalogues
+    can target the heaviest sender.
+    """
+    names = ROLES + FIRST_NAMES
+    tlds = ['com', 'org', 'io', 'net']
+    senders = []
+    for i in range(sender_count):
+        d = i % domain_count
+        domain = f"{WORDS['company'][d % len(WORDS['company'])].lower()}{d}.{tlds[d % len(tlds)]}"
+        local = f"{names[i % len(names)]}{i}"
+        address = f"{local}@{domain}"
+        senders.append((f"{local.title()} <{address}>", address, domain))
+    return senders
+
+
+def generate_rows(count, seed=0, years=5, sender_count=5000, domain_count=500, zipf_s=1.1, run_id=None):
+    """
+    Yield `count` synthetic email rows as tuples in COPY_COLUMNS order, ending
+    with the Gmail label list; label_ids is resolved from it at load time.
+    Senders follow a Zipf distribution and dates are spread over `years`
+    years before today, with recent mail denser. The same seed produces the
+    same rows on a given day; a run_id replaces the seed-derived prefix of
+    gmail_id and thread_id so repeated loads do not collide.
+    """
+    rng = random.Random(seed)
+    senders = _build_senders(sender_count, domain_count)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** zipf_s for rank in range(sender_count)))
+    now = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    span_days = years * 365
+    run_prefix = f"{rng.getrandbits(20):05x}"
+    if run_id is not None:
+        run_prefix = run_id
+
+    for i in range(count):
+        header, address, domain = rng.choices(senders, cum_weights=cum_weights)[0]
+        labels = [label_id for label_id, _, share in LABEL_SHARES if rng.random() < share]
+        date_received = now - datetime.timedelta(days=span_days * rng.random() ** 1.5,
+                                                  seconds=rng.randint(0, 86399))
+        yield (
+            f"{run_prefix}{i:011x}",
+            f"{run_prefix}{max(0, i - rng.randint(0, 3)):011x}",
+            header,
+            address,
+            domain,
+            _fill(rng.choice(SUBJECT_TEMPLATES), rng),
+            _fill(rng.choice(SNIPPET_TEMPLATES), rng),
+            date_received.strftime("%Y-%m-%d %H:%M:%S"),
+            'UNREAD' not in labels,
+            labels,
+        )
+
+
+def _pg_array(values):
+    return "{" + ",".join(str(v) for v in values) + "}"
+
+
+def load_synthetic_emails(count, seed=0, years=5, batch_size=50000, **generator_options):
+    """
+    Bulk-load `count` synthetic rows into the emails table with COPY, in
+    batches of batch_size, then ANALYZE it. Each load gets its own id prefix,
+    so loading the same seed again adds rows instead of hitting the gmail_id
+    unique constraint. Returns the number of rows loaded.
+    """
+    if emails_partitioned():
+        ensure_partitions(since=datetime.date.today() - datetime.timedelta(days=years * 365))
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO labels (gmail_label_id, name)
+                    SELECT * FROM unnest(%s::text[], %s::text[])
+                    ON CONFLICT (gmail_label_id) DO NOTHING
+                    """,
+                    ([l[0] for l in LABEL_SHARES], [l[1] for l in LABEL_SHARES])
+                )
+                cur.execute("SELECT gmail_label_id, id FROM labels WHERE gmail_label_id = ANY(%s);",
+                            ([l[0] for l in LABEL_SHARES],))
+                label_ids = dict(cur.fetchall())
+
+        copy_sql = f"COPY emails ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+        started = time.perf_counter()
+        loaded = 0
+        run_id = uuid.uuid4().hex[:8]
+        logger.info(f"[load_synthetic_emails] Loading {count} rows with id prefix {run_id}")
+        rows = generate_rows(count, seed=seed, years=years, run_id=run_id, **generator_options)
+        while loaded < count:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in itertools.islice(rows, batch_size):
+                labels = row[-1]
+                writer.writerow(row[:-1] + (_pg_array(labels), _pg_array(label_ids[l] for l in labels)))
+                loaded += 1
+            buffer.seek(0)
+            with conn:
+                with conn.cursor() as cur:
+                    cur.copy_expert(copy_sql, buffer)
+            logger.info(f"[load_synthetic_emails] Loaded {loaded}/{count} rows")
+
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE emails;")
+        logger.info(
+            f"[load_synthetic_emails] Loaded {loaded} rows in {time.perf_counter() - started:.1f}s"
+        )
+        return loaded
+    finally:
+        conn.close()
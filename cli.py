@@ -0,0 +1,182 @@
+"""
+Single command-line entry point:
+
+    python cli.py sync | apply-rules | worker | reconcile | bench | generate
+
+Project modules (and with them psycopg2 and the Google client stack) are
+imported inside each subcommand, so `--help` and argument errors return
+without loading them.
+"""
+import argparse
+import datetime
+import os
+import sys
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+@contextmanager
+def _stage_lease(stage):
+    """
+    Hold the lease for this account (ACCOUNT_ID) and stage so replicas on
+    other nodes skip work that is already running. Yields None when another
+    replica holds it, else the Event the work passes on as `stop`. Embedded
+    SQLite deployments are single-node and run unleased.
+    """
+    from db_client.db_client import storage_backend
+
+    if storage_backend() != "postgres":
+        yield threading.Event()
+        return
+
+    from data_handler.lease import hold_lease
+
+    with hold_lease(
+        os.getenv("ACCOUNT_ID", "default"), stage, ttl_seconds=_env_int("LEASE_TTL_SECONDS", 300)
+    ) as lost:
+        yield lost
+
+
+def _sync(args):
+    from db_client.db_client import init_db
+    from mail_clients.process_email import fetch_and_store_emails, backfill_emails
+
+    init_db()
+    with _stage_lease("sync") as lost:
+        if lost is None:
+            return
+        if args.backfill:
+            backfill_emails(
+                args.since,
+                args.until,
+                windows=args.windows or _env_int("BACKFILL_WINDOWS", 8),
+                workers=args.workers or _env_int("BACKFILL_WORKERS", 4),
+                stop=lost,
+            )
+        else:
+            fetch_and_store_emails(stop=lost)
+
+
+def _apply_rules(args):
+    from process_rules import apply_rules
+
+    # A dry run changes nothing, so it never waits on another replica
+    lease = nullcontext(threading.Event()) if args.dry_run else _stage_lease("apply-rules")
+    with lease as lost:
+        if lost is not None:
+            apply_rules(
+                enqueue_only=args.enqueue_only,
+                on_gmail=args.gmail,
+                dry_run=args.dry_run,
+                rules_file=args.rules,
+                stop=lost,
+            )
+
+
+def _worker(args):
+    from db_client.db_client import check_mailbox_account, storage_backend
+    from process_rules import drain_action_queue
+
+    # The queue is not scoped by account, so never drain it with another token
+    if storage_backend() == "postgres":
+        check_mailbox_account()
+    drain_action_queue(
+        batch_size=args.batch_size or _env_int("ACTION_WORKER_BATCH_SIZE", 50),
+        max_attempts=args.max_attempts or _env_int("ACTION_MAX_ATTEMPTS", 5),
+    )
+
+
+def _reconcile(args):
+    from db_client.db_client import init_db
+    from mail_clients.process_email import reconcile_deleted_emails
+
+    init_db()
+    with _stage_lease("reconcile") as lost:
+        if lost is not None:
+            reconcile_deleted_emails(purge=args.purge, stop=lost)
+
+
+def _bench(args):
+    from benchmarks.rule_benchmark import DEFAULT_CATALOG, format_summary, run_benchmarks, write_report
+
+    results = run_benchmarks(args.rules or DEFAULT_CATALOG, repeat=args.repeat, explain=not args.no_explain)
+    print(format_summary(results))
+    if args.output:
+        write_report(results, args.output)
+        print(f"Report written to {args.output}")
+
+
+def _generate(args):
+    from db_client.db_client import init_db
+    from benchmarks.synthetic_emails import load_synthetic_emails
+
+    init_db()
+    load_synthetic_emails(args.rows, seed=args.seed, years=args.years, batch_size=args.batch_size)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Gmail rule-based email processor.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync = subparsers.add_parser("sync", help="sync Gmail messages into the database")
+    sync.add_argument("--backfill", action="store_true",
+                      help="import in parallel date windows instead of one page chain")
+    sync.add_argument("--since", type=datetime.date.fromisoformat, default=datetime.date(2004, 4, 1),
+                      help="first day to backfill (YYYY-MM-DD)")
+    sync.add_argument("--until", type=datetime.date.fromisoformat, default=None,
+                      help="day after the last one to backfill (YYYY-MM-DD)")
+    sync.add_argument("--windows", type=int, default=None, help="backfill windows (BACKFILL_WINDOWS)")
+    sync.add_argument("--workers", type=int, default=None, help="concurrent windows (BACKFILL_WORKERS)")
+    sync.set_defaults(func=_sync)
+
+    apply_rules = subparsers.add_parser("apply-rules", help="match emails against the rules and act on them")
+    apply_rules.add_argument("--rules", default=None, help="rules file (RULES_JSON_PATH)")
+    apply_rules.add_argument("--enqueue-only", action="store_true",
+                             help="only queue the actions for the worker")
+    apply_rules.add_argument("--gmail", action="store_true",
+                             help="run the rules as a Gmail search instead of on the database")
+    apply_rules.add_argument("--dry-run", action="store_true",
+                             help="log what would be done without queuing or acting")
+    apply_rules.set_defaults(func=_apply_rules)
+
+    worker = subparsers.add_parser("worker", help="drain the queued rule actions")
+    worker.add_argument("--batch-size", type=int, default=None, help="ACTION_WORKER_BATCH_SIZE")
+    worker.add_argument("--max-attempts", type=int, default=None, help="ACTION_MAX_ATTEMPTS")
+    worker.set_defaults(func=_worker)
+
+    reconcile = subparsers.add_parser("reconcile", help="tombstone emails deleted in Gmail")
+    reconcile.add_argument("--purge", action="store_true", help="delete rows instead of soft-deleting")
+    reconcile.set_defaults(func=_reconcile)
+
+    bench = subparsers.add_parser("bench", help="time a catalogue of rules files against the database")
+    bench.add_argument("--rules", default=None,
+                       help="rules file or directory of rules files (default: benchmarks/rules)")
+    bench.add_argument("--repeat", type=int, default=5)
+    bench.add_argument("--no-explain", action="store_true", help="skip EXPLAIN ANALYZE plans")
+    bench.add_argument("--output", default=None, help="write a JSON report to this file")
+    bench.set_defaults(func=_bench)
+
+    generate = subparsers.add_parser("generate", help="bulk-load synthetic emails for benchmarking")
+    generate.add_argument("--rows", type=int, default=1_000_000)
+    generate.add_argument("--seed", type=int, default=0)
+    generate.add_argument("--years", type=int, default=5, help="spread dates over this many years")
+    generate.add_argument("--batch-size", type=int, default=50000, help="rows per COPY")
+    generate.set_defaults(func=_generate)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,133 @@
+import traceback
+from db_client.db_client import get_connection
+from logger.logger import get_logger
+
+logger = get_logger(__name__,"logs/action_queue")
+
+class ActionQueueRepository:
+    @staticmethod
+    def enqueue_actions(gmail_ids, actions):
+        """
+        Queue every action for every gmail_id. Pairs that already have an open
+        (pending or in-progress) row are skipped.
+        Returns the number of rows enqueued.
+        """
+        if not gmail_ids or not actions:
+            return 0
+        query = """
+            INSERT INTO email_actions (gmail_id, action)
+            SELECT g, a FROM unnest(%s::text[]) AS g CROSS JOIN unnest(%s::text[]) AS a
+            ON CONFLICT (gmail_id, action) WHERE status IN ('pending', 'in_progress')
+            DO NOTHING
+        """
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (list(gmail_ids), list(actions)))
+                    return cur.rowcount
+        except Exception as e:
+            logger.error("[ActionQueueRepository] Error enqueuing actions: %s", e)
+            logger.debug(traceback.format_exc())
+            return 0
+        finally:
+            conn.close()
+
+    @staticmethod
+    def claim_batch(batch_size, max_attempts=5, claim_timeout_minutes=15):
+        """
+        Claim up to batch_size pending actions for this worker. Rows locked by
+        a concurrent claim are skipped, and rows left in progress longer than
+        claim_timeout_minutes (e.g. by a crashed worker) are claimed again,
+        unless they already used max_attempts; those are marked failed so an
+        action that kills its worker is not retried forever.
+        """
+        expire_query = """
+            UPDATE email_actions
+            SET status = 'failed',
+                last_error = COALESCE(last_error, 'worker did not finish the action'),
+                claimed_at = NULL,
+                updated_at = NOW()
+            WHERE status = 'in_progress'
+              AND claimed_at < NOW() - INTERVAL %s
+              AND attempts >= %s
+        """
+        query = """
+            UPDATE email_actions
+            SET status = 'in_progress',
+                attempts = attempts + 1,
+                claimed_at = NOW(),
+                updated_at = NOW()
+            WHERE id IN (
+                SELECT id FROM email_actions
+                WHERE status = 'pending'
+                   OR (status = 'in_progress' AND claimed_at < NOW() - INTERVAL %s AND attempts < %s)
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, gmail_id, action, attempts
+        """
+        timeout = f"{int(claim_timeout_minutes)} MINUTES"
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(expire_query, (timeout, max_attempts))
+                    if cur.rowcount:
+                        logger.warning(
+                            "[ActionQueueRepository] Gave up on %s abandoned actions after %s attempts",
+                            cur.rowcount, max_attempts
+                        )
+                    cur.execute(query, (timeout, max_attempts, batch_size))
+                    rows = cur.fetchall()
+                    columns = [desc[0] for desc in cur.description]
+                    return [dict(zip(columns, row)) for row in rows]
+        except Exception as e:
+            logger.error("[ActionQueueRepository] Error claiming actions: %s", e)
+            logger.debug(traceback.format_exc())
+            return []
+        finally:
+            conn.close()
+
+    @staticmethod
+    def mark_done(action_ids):
+        if not action_ids:
+            return
+        query = """
+            UPDATE email_actions
+            SET status = 'done', last_error = NULL, updated_at = NOW()
+            WHERE id = ANY(%s)
+        """
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (list(action_ids),))
+        except Exception as e:
+            logger.error("[ActionQueueRepository] Error marking actions done: %s", e)
+            logger.debug(traceback.format_exc())
+        finally:
+            conn.close()
+
+    @staticmethod
+    def mark_failed(action_id, error, max_attempts):
+        """Return the action to the queue, or give up once max_attempts is reached."""
+        query = """
+            UPDATE email_actions
+            SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                last_error = %s,
+                claimed_at = NULL,
+                updated_at = NOW()
+            WHERE id = %s
+        """
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (max_attempts, error, action_id))
+        except Exception as e:
+            logger.error("[ActionQueueRepository] Error marking action failed: %s", e)
+            logger.debug(traceback.format_exc())
+        finally:
+            conn.close()
@@ -0,0 +1,77 @@
+import traceback
+from db_client.db_client import get_connection
+from logger.logger import get_logger
+
+logger = get_logger(__name__,"logs/backfill_checkpoint")
+
+class BackfillCheckpointRepository:
+    @staticmethod
+    def get_windows(run_key):
+        """Return the saved windows of a backfill run, ordered by start."""
+        query = """
+            SELECT window_start, window_end, page_token, processed, status
+            FROM backfill_checkpoints
+            WHERE run_key = %s
+            ORDER BY window_start;
+        """
+        conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(query, (run_key,))
+                rows = cur.fetchall()
+                columns = [desc[0] for desc in cur.description]
+                return [dict(zip(columns, row)) for row in rows]
+        except Exception as e:
+            logger.error("[BackfillCheckpointRepository] Error fetching windows: %s", e)
+            logger.debug(traceback.format_exc())
+            return []
+        finally:
+            conn.close()
+
+    @staticmethod
+    def create_windows(run_key, windows):
+        """
+        Persist the (start, end) epoch windows planned for a backfill run.
+        Returns False when the plan could not be saved.
+        """
+        query = """
+            INSERT INTO backfill_checkpoints (run_key, window_start, window_end)
+            SELECT %s, s, e FROM unnest(%s::bigint[], %s::bigint[]) AS w(s, e)
+            ON CONFLICT (run_key, window_start) DO NOTHING
+        """
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        query,
+                        (run_key, [w[0] for w in windows], [w[1] for w in windows])
+                    )
+            return True
+        except Exception as e:
+            logger.error("[BackfillCheckpointRepository] Error creating windows: %s", e)
+            logger.debug(traceback.format_exc())
+            return False
+        finally:
+            conn.close()
+
+    @staticmethod
+    def save_checkpoint(run_key, window_start, page_token, processed, status):
+        query = """
+            UPDATE backfill_checkpoints
+            SET page_token = %s,
+                processed = %s,
+                status = %s,
+                updated_at = NOW()
+            WHERE run_key = %s AND window_start = %s
+        """
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (page_token, processed, status, run_key, window_start))
+        except Exception as e:
+            logger.error("[BackfillCheckpointRepository] Error saving checkpoint: %s", e)
+            logger.debug(traceback.format_exc())
+        finally:
+            conn.close()
@@ -1,22 +1,94 @@
+import io
+import itertools
 import traceback
-from db_client.db_client import get_connection
+from contextlib import nullcontext
+from db_client.db_client import get_connection, emails_partitioned
 from logger.logger import get_logger
+from email.utils import parseaddr
 import re
 
 logger = get_logger(__name__,"logs/email_processor")
 
+
+def parse_sender(header):
+    """
+    Split a raw From header such as 'Name <Addr@X.com>' into the
+    lower-cased address and domain. Missing parts are returned as None.
+    """
+    address = parseaddr(header or '')[1].strip().lower()
+    if not address:
+        return None, None
+    domain = address.rpartition('@')[2] if '@' in address else None
+    return address, domain or None
+
+
+def has_email_changed(existing_email, new_email):
+    """Whether a fetched message differs from its stored row; shared by both backends."""
+    fields_to_compare = [
+        'thread_id', 'sender', 'sender_email', 'sender_domain',
+        'subject', 'messages', 'date_received', 'is_read', 'labels'
+    ]
+
+    # A tombstoned row must be rewritten so the upsert clears deleted_at
+    if existing_email.get('deleted_at') is not None:
+        return True
+    for field in fields_to_compare:
+        if existing_email.get(field) != new_email.get(field):
+            return True
+    return False
+
+
+# Rule field -> emails column
+RULE_FIELD_COLUMNS = {
+    'from': 'sender',
+    'from domain': 'sender_domain',
+    'subject': 'subject',
+    'message': 'messages',
+    'received date': 'date_received',
+    'received date/time': 'date_received',
+    'label': 'labels',
+}
+
+
+def parse_rule(rule):
+    """
+    Normalise one rule into (column, operator, value) for a backend to turn
+    into SQL, or None if it cannot be compiled. Equality on From runs against
+    the parsed sender_email, and received-date values become a day count.
+    """
+    field = rule['field'].lower()
+    operator = rule['predicate'].lower()
+    value = rule['value']
+
+    column = RULE_FIELD_COLUMNS.get(field)
+    if not column:
+        return None
+
+    if column == 'labels':
+        if operator in ['has', 'does not have']:
+            return column, operator, value
+    elif operator in ['contains', 'does not contain']:
+        return column, operator, value
+    elif operator in ['equals', 'does not equal']:
+        # Sender equality runs against the normalized, indexed columns
+        if field == 'from':
+            return 'sender_email', operator, parse_sender(value)[0] or ''
+        if field == 'from domain':
+            return column, operator, value.strip().lstrip('@').lower()
+        return column, operator, value
+    elif operator in ['less than', 'greater than'] and column == 'date_received':
+        days = re.findall(r"(\d+)\s*days?", value)
+        return (column, operator, int(days[0])) if days else None
+
+    logger.info(f"[parse_rule] Unhandled predicate in rules :: {operator}")
+    return None
+
+
 class EmailRepository:
     @staticmethod
-    def _has_email_changed(existing_email, new_email):
-        fields_to_compare = [
-            'thread_id', 'sender', 'subject', 'messages',
-            'date_received', 'is_read', 'labels'
-        ]
-        
-        for field in fields_to_compare:
-            if existing_email.get(field) != new_email.get(field):
-                return True
-        return False
+    def transaction():
+        """Every Postgres call commits on its own connection, so there is nothing to group."""
+        return nullcontext()
 
     @staticmethod
     def insert_or_update_email(email_record):
@@ -31,23 +103,30 @@ class EmailRepository:
         existing_email = EmailRepository.get_email_by_gmail_id(email_record["gmail_id"])
         
         if existing_email:
-            if not EmailRepository._has_email_changed(existing_email, email_record):
+            if not has_email_changed(existing_email, email_record):
                 logger.debug("[EmailRepository] No changes detected for email gmail_id=%s", email_record["gmail_id"])
                 return 'unchanged'
         
-        query = """
-            INSERT INTO emails (gmail_id, thread_id, sender, subject, messages, 
-                            date_received, is_read, labels)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (gmail_id) 
+        # A partitioned emails table can only be unique on (gmail_id, date_received)
+        conflict_target = "gmail_id, date_received" if emails_partitioned() else "gmail_id"
+        query = f"""
+            INSERT INTO emails (gmail_id, thread_id, sender, sender_email, sender_domain,
+                            subject, messages, date_received, is_read, labels, label_ids)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                    ARRAY(SELECT id FROM labels WHERE gmail_label_id = ANY(%s::text[]) ORDER BY id))
+            ON CONFLICT ({conflict_target}) 
             DO UPDATE SET 
                 thread_id = EXCLUDED.thread_id,
                 sender = EXCLUDED.sender,
+                sender_email = EXCLUDED.sender_email,
+                sender_domain = EXCLUDED.sender_domain,
                 subject = EXCLUDED.subject,
                 messages = EXCLUDED.messages,
                 date_received = EXCLUDED.date_received,
                 is_read = EXCLUDED.is_read,
-                labels = EXCLUDED.labels
+                labels = EXCLUDED.labels,
+                label_ids = EXCLUDED.label_ids,
+                deleted_at = NULL
             RETURNING (xmax = 0) AS is_insert
         """
         conn = get_connection()
@@ -60,11 +139,14 @@ class EmailRepository:
                             email_record["gmail_id"],
                             email_record.get("thread_id"),
                             email_record.get("sender"),
+                            email_record.get("sender_email"),
+                            email_record.get("sender_domain"),
                             email_record.get("subject"),
                             email_record.get("messages"),
                             email_record.get("date_received"),
                             email_record.get("is_read"),
                             email_record.get("labels"),
+                            email_record.get("labels"),
                         )
                     )
                     result = cur.fetchone()
@@ -123,7 +205,8 @@ class EmailRepository:
         query = """
             UPDATE emails
             SET is_read = %s,
-                labels = %s
+                labels = %s,
+                label_ids = ARRAY(SELECT id FROM labels WHERE gmail_label_id = ANY(%s::text[]) ORDER BY id)
             WHERE gmail_id = %s
         """
         conn = get_connection()
@@ -135,6 +218,7 @@ class EmailRepository:
                         (
                             email_record["is_read"],
                             email_record["labels"],
+                            email_record["labels"],
                             email_record["gmail_id"],
                         )
                     )
@@ -143,57 +227,231 @@ class EmailRepository:
             logger.debug(traceback.format_exc())
         finally:
             conn.close()
-    
+
     @staticmethod
-    def get_emails_by_conditions(rules: list, predicate: str) -> list:
+    def set_read(gmail_id, is_read):
+        """
+        Set is_read and drop or add the UNREAD label to match, in place, so a
+        concurrent label change to the row is kept.
+        """
+        logger.debug("[EmailRepository] Setting is_read=%s for gmail_id=%s", is_read, gmail_id)
+        new_labels = """
+            CASE WHEN %(is_read)s THEN array_remove(emails.labels, 'UNREAD')
+                 ELSE array_append(array_remove(emails.labels, 'UNREAD'), 'UNREAD')
+            END
+        """
+        query = f"""
+            UPDATE emails
+            SET is_read = %(is_read)s,
+                labels = {new_labels},
+                label_ids = ARRAY(
+                    SELECT id FROM labels WHERE gmail_label_id = ANY({new_labels}) ORDER BY id
+                )
+            WHERE gmail_id = %(gmail_id)s
+        """
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, {'is_read': is_read, 'gmail_id': gmail_id})
+        except Exception as e:
+            logger.error("[EmailRepository] Error setting is_read: %s", e)
+            logger.debug(traceback.format_exc())
+        finally:
+            conn.close()
+
+    @staticmethod
+    def add_label(gmail_id, gmail_label_id):
+        """
+        Append one label to the row's current labels and label_ids in place,
+        so a concurrent is_read or label change to the row is kept.
+        """
+        logger.debug("[EmailRepository] Adding label %s to gmail_id=%s", gmail_label_id, gmail_id)
+        query = """
+            UPDATE emails
+            SET labels = array_append(labels, %s::text),
+                label_ids = ARRAY(
+                    SELECT id FROM labels
+                    WHERE gmail_label_id = ANY(array_append(emails.labels, %s::text))
+                    ORDER BY id
+                )
+            WHERE gmail_id = %s
+              AND NOT (%s = ANY(COALESCE(labels, '{}')))
+        """
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (gmail_label_id, gmail_label_id, gmail_id, gmail_label_id))
+        except Exception as e:
+            logger.error("[EmailRepository] Error adding label: %s", e)
+            logger.debug(traceback.format_exc())
+        finally:
+            conn.close()
+
+    @staticmethod
+    def iter_missing_gmail_ids(listed_ids, include_deleted=False, batch_size=5000):
+        """
+        Yield stored gmail_ids that are not among `listed_ids`, an iterable of
+        Gmail message ids. The ids are copied into a temporary table
+        batch_size at a time and matched with an index-backed anti-join read
+        through a server-side cursor, so neither side is held in memory.
+        Nothing is yielded until `listed_ids` is exhausted, so an error while
+        listing never reports a row as missing.
+        """
+        query = """
+            SELECT e.gmail_id FROM emails e
+            WHERE NOT EXISTS (SELECT 1 FROM gmail_listing g WHERE g.gmail_id = e.gmail_id)
+        """
+        if not include_deleted:
+            query += " AND e.deleted_at IS NULL"
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("CREATE TEMP TABLE gmail_listing (gmail_id VARCHAR(255)) ON COMMIT DROP;")
+                    ids = iter(listed_ids)
+                    while True:
+                        chunk = list(itertools.islice(ids, batch_size))
+                        if not chunk:
+                            break
+                        cur.copy_expert(
+                            "COPY gmail_listing (gmail_id) FROM STDIN",
+                            io.StringIO("".join(f"{gmail_id}\n" for gmail_id in chunk))
+                        )
+                    cur.execute("CREATE INDEX ON gmail_listing (gmail_id);")
+                    cur.execute("ANALYZE gmail_listing;")
+                with conn.cursor(name="emails_missing_gmail_ids") as cur:
+                    cur.itersize = batch_size
+                    cur.execute(query)
+                    for row in cur:
+                        yield row[0]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def tombstone_emails(gmail_ids, purge=False):
+        """
+        Soft-delete (or with purge=True, delete) the given emails.
+        Returns the number of rows affected.
+        """
+        if not gmail_ids:
+            return 0
+        if purge:
+            query = "DELETE FROM emails WHERE gmail_id = ANY(%s);"
+        else:
+            query = "UPDATE emails SET deleted_at = NOW() WHERE gmail_id = ANY(%s) AND deleted_at IS NULL;"
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (list(gmail_ids),))
+                    return cur.rowcount
+        except Exception as e:
+            logger.error("[EmailRepository] Error tombstoning emails: %s", e)
+            logger.debug(traceback.format_exc())
+            return 0
+        finally:
+            conn.close()
+
+    @staticmethod
+    def upsert_labels(labels):
+        """
+        Store Gmail labels (dicts with 'id' and 'name') in the labels dimension,
+        refreshing names of labels that were renamed in Gmail.
+        """
+        if not labels:
+            return
+        query = """
+            INSERT INTO labels (gmail_label_id, name)
+            SELECT * FROM unnest(%s::text[], %s::text[])
+            ON CONFLICT (gmail_label_id)
+            DO UPDATE SET name = EXCLUDED.name
+        """
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        query,
+                        (
+                            [lbl['id'] for lbl in labels],
+                            [lbl.get('name', lbl['id']) for lbl in labels],
+                        )
+                    )
+        except Exception as e:
+            logger.error("[EmailRepository] Error upserting labels: %s", e)
+            logger.debug(traceback.format_exc())
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get_label_ids(label):
+        """Return the dimension ids of labels whose name or Gmail ID matches `label`."""
+        query = "SELECT id FROM labels WHERE lower(name) = lower(%s) OR gmail_label_id = %s;"
+        conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(query, (label, label))
+                return [row[0] for row in cur.fetchall()]
+        except Exception as e:
+            logger.error("[EmailRepository] Error fetching label ids: %s", e)
+            logger.debug(traceback.format_exc())
+            return []
+        finally:
+            conn.close()
+
+    @staticmethod
+    def build_conditions_query(rules: list, predicate: str):
+        """
+        Compile rules into the SELECT run by get_emails_by_conditions.
+        Returns (query, params), or None if no rule could be compiled.
+        """
         where_clauses = []
         params = []
         for rule in rules:
-            field = rule['field'].lower()
-            operator = rule['predicate'].lower()
-            value = rule['value']
-            
-            field_map = {
-                'from': 'sender',
-                'subject': 'subject',
-                'message': 'messages',
-                'received date': 'date_received',
-                'received date/time': 'date_received'
-            }
-            
-            db_column = field_map.get(field)
-            if not db_column:
-                continue  
-
-            # Convert operator to SQL
-            if operator in ['contains', 'does not contain']:
-                clause = f"{db_column} {'NOT ' if 'not' in operator else ''}ILIKE %s"
+            parsed = parse_rule(rule)
+            if parsed is None:
+                continue
+            column, operator, value = parsed
+            negate = 'not' in operator
+
+            if column == 'labels':
+                # Label filters compile to GIN-indexed overlap on label_ids
+                if negate:
+                    clause = "NOT (COALESCE(label_ids, '{}') && %s::integer[])"
+                else:
+                    clause = "label_ids && %s::integer[]"
+                val = EmailRepository.get_label_ids(value)
+            elif operator in ['contains', 'does not contain']:
+                clause = f"{column} {'NOT ' if negate else ''}ILIKE %s"
                 val = f"%{value}%"
             elif operator in ['equals', 'does not equal']:
-                clause = f"{db_column} {'!' if 'not' in operator else ''}= %s"
+                clause = f"{column} {'!' if negate else ''}= %s"
                 val = value
-            elif operator in ['less than', 'greater than'] and field in ['received date', 'received date/time']:
-                days = re.findall(r"(\d+)\s*days?", value)
-                if not days:
-                    continue
-                days = int(days[0])
-                clause = f"(NOW() - date_received) {'<' if 'less' in operator else '>'} INTERVAL %s"
-                val = f"{days} DAYS"
             else:
-                logger.info(f"[EmailRepository] Unhandled predicate in rules :: {operator}")
-                continue
-            
+                # Compare the bare column so indexes and partition pruning apply
+                clause = f"date_received {'>' if operator == 'less than' else '<'} NOW() - INTERVAL %s"
+                val = f"{value} DAYS"
+
             where_clauses.append(clause)
             params.append(val)
         if not where_clauses:
-            return []
+            return None
 
         # Combine clauses with AND/OR
         join_operator = " AND " if predicate.lower() == "all" else " OR "
-        where_sql = join_operator.join(where_clauses)
+        where_sql = f"deleted_at IS NULL AND ({join_operator.join(where_clauses)})"
+
+        return f"SELECT * FROM emails WHERE {where_sql};", params
+
+    @staticmethod
+    def get_emails_by_conditions(rules: list, predicate: str) -> list:
+        compiled = EmailRepository.build_conditions_query(rules, predicate)
+        if compiled is None:
+            return []
+        query, params = compiled
 
-        query = f"SELECT * FROM emails WHERE {where_sql};"
- 
         conn = get_connection()
         try:
             with conn.cursor() as cur:
@@ -0,0 +1,117 @@
+import os
+import socket
+import threading
+import traceback
+import uuid
+from contextlib import contextmanager
+from db_client.db_client import get_connection
+from logger.logger import get_logger
+
+logger = get_logger(__name__,"logs/lease")
+
+# Identifies this process as a lease holder across nodes
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class LeaseRepository:
+    @staticmethod
+    def acquire(account, stage, holder, ttl_seconds):
+        """
+        Take the (account, stage) lease if it is free, expired, or already ours.
+        Returns True if `holder` owns the lease afterwards.
+        """
+        query = """
+            INSERT INTO run_leases (account, stage, holder, expires_at)
+            VALUES (%s, %s, %s, NOW() + %s * INTERVAL '1 second')
+            ON CONFLICT (account, stage)
+            DO UPDATE SET
+                holder = EXCLUDED.holder,
+                acquired_at = NOW(),
+                heartbeat_at = NOW(),
+                expires_at = EXCLUDED.expires_at
+            WHERE run_leases.expires_at < NOW() OR run_leases.holder = EXCLUDED.holder
+            RETURNING holder
+        """
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (account, stage, holder, ttl_seconds))
+                    return cur.fetchone() is not None
+        except Exception as e:
+            logger.error("[LeaseRepository] Error acquiring lease: %s", e)
+            logger.debug(traceback.format_exc())
+            return False
+        finally:
+            conn.close()
+
+    @staticmethod
+    def heartbeat(account, stage, holder, ttl_seconds):
+        """Extend the lease. Returns False if `holder` no longer owns it."""
+        query = """
+            UPDATE run_leases
+            SET heartbeat_at = NOW(),
+                expires_at = NOW() + %s * INTERVAL '1 second'
+            WHERE account = %s AND stage = %s AND holder = %s
+        """
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (ttl_seconds, account, stage, holder))
+                    return cur.rowcount == 1
+        except Exception as e:
+            logger.error("[LeaseRepository] Error renewing lease: %s", e)
+            logger.debug(traceback.format_exc())
+            return False
+        finally:
+            conn.close()
+
+    @staticmethod
+    def release(account, stage, holder):
+        query = "DELETE FROM run_leases WHERE account = %s AND stage = %s AND holder = %s;"
+        conn = get_connection()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(query, (account, stage, holder))
+        except Exception as e:
+            logger.error("[LeaseRepository] Error releasing lease: %s", e)
+            logger.debug(traceback.format_exc())
+        finally:
+            conn.close()
+
+
+@contextmanager
+def hold_lease(account, stage, ttl_seconds=300):
+    """
+    Hold the (account, stage) lease for the duration of the block, renewing
+    it every ttl_seconds / 3 from a background thread. Yields None, without
+    waiting, when another live replica holds it. Otherwise yields an Event
+    that is set if a renewal fails; the work must check it and stop, as the
+    lease may then be taken over by another replica. If this process dies
+    the lease simply expires and the next replica takes it over.
+    """
+    if not LeaseRepository.acquire(account, stage, HOLDER_ID, ttl_seconds):
+        logger.info(f"[hold_lease] {stage} for account '{account}' is held by another replica. Skipping.")
+        yield None
+        return
+
+    logger.debug(f"[hold_lease] Acquired {stage} lease for account '{account}' as {HOLDER_ID}")
+    stopped = threading.Event()
+    lost = threading.Event()
+
+    def renew():
+        while not stopped.wait(ttl_seconds / 3):
+            if not LeaseRepository.heartbeat(account, stage, HOLDER_ID, ttl_seconds):
+                logger.error(f"[hold_lease] Lost {stage} lease for account '{account}'. Stopping.")
+                lost.set()
+                return
+
+    heartbeat_thread = threading.Thread(target=renew, name=f"lease-{stage}", daemon=True)
+    heartbeat_thread.start()
+    try:
+        yield lost
+    finally:
+        stopped.set()
+        heartbeat_thread.join()
+        LeaseRepository.release(account, stage, HOLDER_ID)
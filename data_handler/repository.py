@@ -0,0 +1,16 @@
+from db_client.db_client import storage_backend
+from data_handler.email_processor import EmailRepository
+
+
+def get_email_repository():
+    """
+    Return the EmailRepository implementation for STORAGE_BACKEND.
+    Both expose the same static methods (insert_or_update_email,
+    get_email_by_gmail_id, get_all_emails, update_email, set_read,
+    add_label, get_emails_by_conditions, upsert_labels, get_label_ids,
+    iter_missing_gmail_ids, tombstone_emails and transaction).
+    """
+    if storage_backend() == "sqlite":
+        from data_handler.sqlite_email_repository import SqliteEmailRepository
+        return SqliteEmailRepository
+    return EmailRepository
@@ -0,0 +1,433 @@
+import datetime
+import itertools
+import json
+import threading
+import traceback
+from contextlib import contextmanager
+from db_client.sqlite_client import get_sqlite_connection
+from data_handler.email_processor import has_email_changed, parse_rule
+from logger.logger import get_logger
+
+logger = get_logger(__name__,"logs/sqlite_email_repository")
+
+_state = threading.local()
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Columns covered by the emails_fts trigram index
+FTS_COLUMNS = ['sender', 'subject', 'messages']
+
+
+def _to_db_date(value):
+    """Store dates as naive UTC text, which sorts and compares like datetime('now')."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.strftime(DATE_FORMAT)
+
+
+def _from_row(columns, row):
+    email = dict(zip(columns, row))
+    if email.get("date_received"):
+        email["date_received"] = datetime.datetime.strptime(email["date_received"], DATE_FORMAT)
+    if email.get("is_read") is not None:
+        email["is_read"] = bool(email["is_read"])
+    email["labels"] = json.loads(email["labels"]) if email.get("labels") else []
+    return email
+
+
+class SqliteEmailRepository:
+    """Embedded SQLite implementation of the EmailRepository interface."""
+
+    @staticmethod
+    @contextmanager
+    def transaction():
+        """
+        Group every write made inside the block into one SQLite transaction,
+        committed on exit. Nested blocks join the outermost one.
+        """
+        conn = get_sqlite_connection()
+        depth = getattr(_state, "depth", 0)
+        _state.depth = depth + 1
+        try:
+            yield
+            if depth == 0:
+                conn.commit()
+        except Exception:
+            if depth == 0:
+                conn.rollback()
+            raise
+        finally:
+            _state.depth = depth
+
+    @staticmethod
+    def _commit(conn):
+        if not getattr(_state, "depth", 0):
+            conn.commit()
+
+    @staticmethod
+    def _sync_email_labels(cur, gmail_id, labels):
+        cur.execute(
+            "DELETE FROM email_labels WHERE email_id = (SELECT id FROM emails WHERE gmail_id = ?);",
+            (gmail_id,)
+        )
+        cur.execute(
+            """
+            INSERT INTO email_labels (label_id, email_id)
+            SELECT l.id, e.id FROM labels l, emails e
+            WHERE e.gmail_id = ? AND l.gmail_label_id IN (SELECT value FROM json_each(?))
+            """,
+            (gmail_id, json.dumps(labels or []))
+        )
+
+    @staticmethod
+    def insert_or_update_email(email_record):
+        """
+        Insert new email or update existing one if data has changed.
+        Returns:
+            'created' - if new record was inserted
+            'updated' - if existing record was updated
+            'unchanged' - if existing record had no changes
+        """
+        normalized = dict(email_record)
+        date_received = _to_db_date(email_record.get("date_received"))
+        normalized["date_received"] = (
+            datetime.datetime.strptime(date_received, DATE_FORMAT) if date_received else None
+        )
+        normalized["labels"] = list(email_record.get("labels") or [])
+
+        existing_email = SqliteEmailRepository.get_email_by_gmail_id(email_record["gmail_id"])
+        if existing_email:
+            if not has_email_changed(existing_email, normalized):
+                logger.debug("[SqliteEmailRepository] No changes detected for email gmail_id=%s", email_record["gmail_id"])
+                return 'unchanged'
+
+        query = """
+            INSERT INTO emails (gmail_id, thread_id, sender, sender_email, sender_domain,
+                            subject, messages, date_received, is_read, labels)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (gmail_id)
+            DO UPDATE SET
+                thread_id = excluded.thread_id,
+                sender = excluded.sender,
+                sender_email = excluded.sender_email,
+                sender_domain = excluded.sender_domain,
+                subject = excluded.subject,
+                messages = excluded.messages,
+                date_received = excluded.date_received,
+                is_read = excluded.is_read,
+                labels = excluded.labels,
+                deleted_at = NULL
+        """
+        conn = get_sqlite_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                query,
+                (
+                    email_record["gmail_id"],
+                    email_record.get("thread_id"),
+                    email_record.get("sender"),
+                    email_record.get("sender_email"),
+                    email_record.get("sender_domain"),
+                    email_record.get("subject"),
+                    email_record.get("messages"),
+                    date_received,
+                    email_record.get("is_read"),
+                    json.dumps(normalized["labels"]),
+                )
+            )
+            SqliteEmailRepository._sync_email_labels(cur, email_record["gmail_id"], normalized["labels"])
+            SqliteEmailRepository._commit(conn)
+            return 'updated' if existing_email else 'created'
+        except Exception as e:
+            logger.error("[SqliteEmailRepository] Error upserting email: %s", e)
+            logger.debug(traceback.format_exc())
+            return 'error'
+
+    @staticmethod
+    def get_email_by_gmail_id(gmail_id):
+        query = "SELECT * FROM emails WHERE gmail_id = ?;"
+        conn = get_sqlite_connection()
+        try:
+            cur = conn.execute(query, (gmail_id,))
+            row = cur.fetchone()
+            if row:
+                columns = [desc[0] for desc in cur.description]
+                return _from_row(columns, row)
+            return None
+        except Exception as e:
+            logger.error("[SqliteEmailRepository] Error fetching email by gmail_id: %s", e)
+            logger.debug(traceback.format_exc())
+            return None
+
+    @staticmethod
+    def get_all_emails():
+        query = "SELECT * FROM emails;"
+        conn = get_sqlite_connection()
+        try:
+            cur = conn.execute(query)
+            columns = [desc[0] for desc in cur.description]
+            return [_from_row(columns, row) for row in cur.fetchall()]
+        except Exception as e:
+            logger.error("[SqliteEmailRepository] Error fetching all emails: %s", e)
+            logger.debug(traceback.format_exc())
+
+    @staticmethod
+    def update_email(email_record):
+        logger.debug(
+            "[SqliteEmailRepository] Updating email with gmail_id=%s, is_read=%s, labels=%s",
+            email_record.get("gmail_id"),
+            email_record.get("is_read"),
+            email_record.get("labels")
+        )
+        query = """
+            UPDATE emails
+            SET is_read = ?,
+                labels = ?
+            WHERE gmail_id = ?
+        """
+        conn = get_sqlite_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                query,
+                (
+                    email_record["is_read"],
+                    json.dumps(email_record["labels"] or []),
+                    email_record["gmail_id"],
+                )
+            )
+            SqliteEmailRepository._sync_email_labels(cur, email_record["gmail_id"], email_record["labels"])
+            SqliteEmailRepository._commit(conn)
+        except Exception as e:
+            logger.error("[SqliteEmailRepository] Error updating email: %s", e)
+            logger.debug(traceback.format_exc())
+
+    @staticmethod
+    def set_read(gmail_id, is_read):
+        """Set is_read and drop or add the UNREAD label to match, keeping any concurrent change."""
+        logger.debug("[SqliteEmailRepository] Setting is_read=%s for gmail_id=%s", is_read, gmail_id)
+        conn = get_sqlite_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                UPDATE emails
+                SET is_read = ?,
+                    labels = (
+                        SELECT json_group_array(value) FROM (
+                            SELECT value FROM json_each(COALESCE(emails.labels, '[]'))
+                            WHERE value != 'UNREAD'
+                            UNION ALL
+                            SELECT 'UNREAD' WHERE NOT ?
+                        )
+                    )
+                WHERE gmail_id = ?
+                """,
+                (is_read, is_read, gmail_id)
+            )
+            if is_read:
+                cur.execute(
+                    """
+                    DELETE FROM email_labels
+                    WHERE email_id = (SELECT id FROM emails WHERE gmail_id = ?)
+                      AND label_id IN (SELECT id FROM labels WHERE gmail_label_id = 'UNREAD')
+                    """,
+                    (gmail_id,)
+                )
+            else:
+                cur.execute(
+                    """
+                    INSERT OR IGNORE INTO email_labels (label_id, email_id)
+                    SELECT l.id, e.id FROM labels l, emails e
+                    WHERE e.gmail_id = ? AND l.gmail_label_id = 'UNREAD'
+                    """,
+                    (gmail_id,)
+                )
+            SqliteEmailRepository._commit(conn)
+        except Exception as e:
+            logger.error("[SqliteEmailRepository] Error setting is_read: %s", e)
+            logger.debug(traceback.format_exc())
+
+    @staticmethod
+    def add_label(gmail_id, gmail_label_id):
+        """Append one label to the row's current labels, keeping any concurrent change."""
+        logger.debug("[SqliteEmailRepository] Adding label %s to gmail_id=%s", gmail_label_id, gmail_id)
+        conn = get_sqlite_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                UPDATE emails SET labels = json_insert(COALESCE(labels, '[]'), '$[#]', ?)
+                WHERE gmail_id = ?
+                  AND NOT EXISTS (SELECT 1 FROM json_each(COALESCE(emails.labels, '[]')) WHERE value = ?)
+                """,
+                (gmail_label_id, gmail_id, gmail_label_id)
+            )
+            cur.execute(
+                """
+                INSERT OR IGNORE INTO email_labels (label_id, email_id)
+                SELECT l.id, e.id FROM labels l, emails e
+                WHERE e.gmail_id = ? AND l.gmail_label_id = ?
+                """,
+                (gmail_id, gmail_label_id)
+            )
+            SqliteEmailRepository._commit(conn)
+        except Exception as e:
+            logger.error("[SqliteEmailRepository] Error adding label: %s", e)
+            logger.debug(traceback.format_exc())
+
+    @staticmethod
+    def iter_missing_gmail_ids(listed_ids, include_deleted=False, batch_size=5000):
+        """
+        Yield stored gmail_ids that are not among `listed_ids`. The ids are
+        staged in a temporary table on a dedicated connection, so tombstoning
+        through the shared connection can run alongside, and matched with an
+        indexed anti-join. Nothing is yielded until `listed_ids` is exhausted.
+        """
+        query = """
+            SELECT e.gmail_id FROM emails e
+            WHERE NOT EXISTS (SELECT 1 FROM gmail_listing g WHERE g.gmail_id = e.gmail_id)
+        """
+        if not include_deleted:
+            query += " AND e.deleted_at IS NULL"
+        conn = get_sqlite_connection(shared=False)
+        try:
+            conn.execute("CREATE TEMP TABLE gmail_listing (gmail_id TEXT);")
+            ids = iter(listed_ids)
+            while True:
+                chunk = list(itertools.islice(ids, batch_size))
+                if not chunk:
+                    break
+                conn.executemany("INSERT INTO gmail_listing (gmail_id) VALUES (?);", ((i,) for i in chunk))
+            conn.execute("CREATE INDEX temp.idx_gmail_listing ON gmail_listing (gmail_id);")
+            conn.commit()
+            cur = conn.execute(query)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row[0]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def tombstone_emails(gmail_ids, purge=False):
+        """
+        Soft-delete (or with purge=True, delete) the given emails.
+        Returns the number of rows affected.
+        """
+        if not gmail_ids:
+            return 0
+        if purge:
+            query = "DELETE FROM emails WHERE gmail_id IN (SELECT value FROM json_each(?));"
+        else:
+            query = """
+                UPDATE emails SET deleted_at = datetime('now')
+                WHERE gmail_id IN (SELECT value FROM json_each(?)) AND deleted_at IS NULL;
+            """
+        conn = get_sqlite_connection()
+        try:
+            cur = conn.execute(query, (json.dumps(list(gmail_ids)),))
+            SqliteEmailRepository._commit(conn)
+            return cur.rowcount
+        except Exception as e:
+            logger.error("[SqliteEmailRepository] Error tombstoning emails: %s", e)
+            logger.debug(traceback.format_exc())
+            return 0
+
+    @staticmethod
+    def upsert_labels(labels):
+        """
+        Store Gmail labels (dicts with 'id' and 'name') in the labels table,
+        refreshing names of labels that were renamed in Gmail.
+        """
+        if not labels:
+            return
+        query = """
+            INSERT INTO labels (gmail_label_id, name)
+            VALUES (?, ?)
+            ON CONFLICT (gmail_label_id)
+            DO UPDATE SET name = excluded.name
+        """
+        conn = get_sqlite_connection()
+        try:
+            conn.executemany(query, [(lbl['id'], lbl.get('name', lbl['id'])) for lbl in labels])
+            SqliteEmailRepository._commit(conn)
+        except Exception as e:
+            logger.error("[SqliteEmailRepository] Error upserting labels: %s", e)
+            logger.debug(traceback.format_exc())
+
+    @staticmethod
+    def get_label_ids(label):
+        """Return the ids of labels whose name or Gmail ID matches `label`."""
+        query = "SELECT id FROM labels WHERE name = ? COLLATE NOCASE OR gmail_label_id = ?;"
+        conn = get_sqlite_connection()
+        try:
+            return [row[0] for row in conn.execute(query, (label, label)).fetchall()]
+        except Exception as e:
+            logger.error("[SqliteEmailRepository] Error fetching label ids: %s", e)
+            logger.debug(traceback.format_exc())
+            return []
+
+    @staticmethod
+    def get_emails_by_conditions(rules: list, predicate: str) -> list:
+        where_clauses = []
+        params = []
+        for rule in rules:
+            parsed = parse_rule(rule)
+            if parsed is None:
+                continue
+            column, operator, value = parsed
+            negate = 'not' in operator
+
+            if column == 'labels':
+                clause = f"""id {'NOT ' if negate else ''}IN (
+                    SELECT el.email_id FROM email_labels el JOIN labels l ON l.id = el.label_id
+                    WHERE l.name = ? COLLATE NOCASE OR l.gmail_label_id = ?)"""
+                where_clauses.append(clause)
+                params.extend([value, value])
+                continue
+
+            if operator in ['contains', 'does not contain']:
+                # Trigrams need at least three characters; shorter values fall back to LIKE
+                if column in FTS_COLUMNS and len(value) >= 3:
+                    clause = (
+                        f"id {'NOT ' if negate else ''}IN "
+                        f"(SELECT rowid FROM emails_fts WHERE emails_fts MATCH ?)"
+                    )
+                    escaped = value.replace('"', '""')
+                    val = f'{column} : "{escaped}"'
+                else:
+                    clause = f"{column} {'NOT ' if negate else ''}LIKE ?"
+                    val = f"%{value}%"
+                if negate:
+                    clause = f"{column} IS NOT NULL AND {clause}"
+            elif operator in ['equals', 'does not equal']:
+                clause = f"{column} {'!' if negate else ''}= ?"
+                val = value
+            else:
+                clause = f"date_received {'>' if operator == 'less than' else '<'} datetime('now', ?)"
+                val = f"-{value} days"
+
+            where_clauses.append(f"({clause})")
+            params.append(val)
+        if not where_clauses:
+            return []
+
+        join_operator = " AND " if predicate.lower() == "all" else " OR "
+        where_sql = f"deleted_at IS NULL AND ({join_operator.join(where_clauses)})"
+
+        query = f"SELECT * FROM emails WHERE {where_sql};"
+
+        conn = get_sqlite_connection()
+        try:
+            cur = conn.execute(query, params)
+            columns = [desc[0] for desc in cur.description]
+            return [_from_row(columns, row) for row in cur.fetchall()]
+        except Exception as e:
+            logger.error("[SqliteEmailRepository] Error fetching filtered emails: %s", e)
+            return []
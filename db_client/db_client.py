@@ -1,11 +1,21 @@
 import os
-import psycopg2
-from psycopg2 import sql
+import re
+import datetime
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from logger.logger import get_logger
 
+logger = get_logger(__name__,"logs/db_client")
+
+PARTITION_NAME_PATTERN = re.compile(r"^emails_p(\d{4})_(\d{2})$")
+
+# Advisory lock key serializing init_db across replicas (arbitrary, app-wide)
+SCHEMA_LOCK_KEY = 7_238_604_515
 
 
 def get_connection():
+    import psycopg2
+
     load_dotenv()
     # Read from environment
     db_name = os.getenv("DB_NAME")
@@ -22,8 +32,546 @@ def get_connection():
         port=db_port
     )
 
+# Tables created before sender normalization only have the raw From header
+# in `sender`; add the parsed columns, which backfill_sender_columns fills.
+SENDER_MIGRATION_QUERIES = [
+    "ALTER TABLE emails ADD COLUMN IF NOT EXISTS sender_email VARCHAR(255);",
+    "ALTER TABLE emails ADD COLUMN IF NOT EXISTS sender_domain VARCHAR(255);",
+    "CREATE INDEX IF NOT EXISTS idx_emails_sender_email ON emails (sender_email);",
+    "CREATE INDEX IF NOT EXISTS idx_emails_sender_domain ON emails (sender_domain);",
+]
+
+# Shape of a Gmail label ID: a user label (Label_<n>) or an upper-case
+# system label such as INBOX or YELLOW_STAR. Older move_to_label versions
+# appended display names to emails.labels; those are not IDs and must not
+# become rows of the label dimension.
+GMAIL_LABEL_ID_PATTERN = "^(Label_[0-9]+|[A-Z][A-Z0-9_]*)$"
+
+# schema_migrations name recorded once backfill_sender_columns has finished
+SENDER_BACKFILL_MIGRATION = "parse_sender_columns"
+
+# Names of the one-time data migrations already applied to this database.
+SCHEMA_MIGRATION_QUERIES = [
+    """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        name VARCHAR(255) PRIMARY KEY,
+        applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """,
+]
+
+# Label dimension: Gmail label ID -> display name, referenced from
+# emails.label_ids so label filters become indexed array containment.
+LABEL_MIGRATION_QUERIES = [
+    """
+    CREATE TABLE IF NOT EXISTS labels (
+        id SERIAL PRIMARY KEY,
+        gmail_label_id VARCHAR(255) NOT NULL UNIQUE,
+        name VARCHAR(255) NOT NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_labels_name ON labels (lower(name));",
+    "ALTER TABLE emails ADD COLUMN IF NOT EXISTS label_ids INTEGER[];",
+    f"""
+    INSERT INTO labels (gmail_label_id, name)
+    SELECT DISTINCT l, l FROM emails, unnest(labels) AS l
+    WHERE label_ids IS NULL AND l ~ '{GMAIL_LABEL_ID_PATTERN}'
+    ON CONFLICT (gmail_label_id) DO NOTHING;
+    """,
+    """
+    UPDATE emails
+    SET label_ids = ARRAY(
+        SELECT lb.id FROM labels lb WHERE lb.gmail_label_id = ANY(emails.labels) ORDER BY lb.id
+    )
+    WHERE label_ids IS NULL AND labels IS NOT NULL;
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_emails_label_ids ON emails USING GIN (label_ids);",
+]
+
+# Outbox of Gmail actions produced by rule matching; drained by workers
+# that claim rows with FOR UPDATE SKIP LOCKED.
+ACTION_QUEUE_QUERIES = [
+    """
+    CREATE TABLE IF NOT EXISTS email_actions (
+        id BIGSERIAL PRIMARY KEY,
+        gmail_id VARCHAR(255) NOT NULL,
+        action TEXT NOT NULL,
+        status VARCHAR(16) NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        claimed_at TIMESTAMP,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_email_actions_open
+    ON email_actions (gmail_id, action) WHERE status IN ('pending', 'in_progress');
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_email_actions_status ON email_actions (status, id);",
+]
+
+# Soft-delete marker for messages that no longer exist in Gmail.
+TOMBSTONE_QUERIES = [
+    "ALTER TABLE emails ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;",
+]
+
+# Window plan and resume point of each date-sliced backfill run.
+BACKFILL_QUERIES = [
+    """
+    CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+        run_key VARCHAR(64) NOT NULL,
+        window_start BIGINT NOT NULL,
+        window_end BIGINT NOT NULL,
+        page_token TEXT,
+        processed INTEGER NOT NULL DEFAULT 0,
+        status VARCHAR(16) NOT NULL DEFAULT 'pending',
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (run_key, window_start)
+    );
+    """,
+]
+
+# One row per (account, stage) currently owned by a replica; expired leases
+# may be taken over by anyone.
+LEASE_QUERIES = [
+    """
+    CREATE TABLE IF NOT EXISTS run_leases (
+        account VARCHAR(255) NOT NULL,
+        stage VARCHAR(64) NOT NULL,
+        holder VARCHAR(255) NOT NULL,
+        acquired_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        heartbeat_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        expires_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (account, stage)
+    );
+    """,
+    # The mail tables are not scoped by account, so a database holds a
+    # single mailbox; this row records which ACCOUNT_ID it belongs to.
+    """
+    CREATE TABLE IF NOT EXISTS mailbox_account (
+        singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+        account VARCHAR(255) NOT NULL
+    );
+    """,
+]
+
+# Data fixes applied once per database, after SCHEMA_QUERIES, in the same
+# transaction that records their name in schema_migrations.
+ONE_TIME_MIGRATIONS = [
+    # Drop the display-name rows an earlier label backfill created (it copied
+    # every emails.labels entry with name = gmail_label_id) and unlink them
+    ("drop_label_display_names", [
+        f"""
+        WITH removed AS (
+            DELETE FROM labels
+            WHERE gmail_label_id = name AND gmail_label_id !~ '{GMAIL_LABEL_ID_PATTERN}'
+            RETURNING id
+        )
+        UPDATE emails
+        SET label_ids = ARRAY(SELECT x FROM unnest(label_ids) AS x WHERE x NOT IN (SELECT id FROM removed))
+        WHERE label_ids && ARRAY(SELECT id FROM removed);
+        """,
+    ]),
+]
+
+# Applied in order after the emails table exists; every statement is idempotent.
+SCHEMA_QUERIES = (
+    SCHEMA_MIGRATION_QUERIES
+    + SENDER_MIGRATION_QUERIES
+    + LABEL_MIGRATION_QUERIES
+    + ACTION_QUEUE_QUERIES
+    + TOMBSTONE_QUERIES
+    + BACKFILL_QUERIES
+    + LEASE_QUERIES
+)
+
+def storage_backend():
+    """Configured storage backend (STORAGE_BACKEND): 'postgres' or 'sqlite'."""
+    load_dotenv()
+    return os.getenv("STORAGE_BACKEND", "postgres").lower()
+
+def partitioning_enabled():
+    """Whether the emails table is range-partitioned by month (EMAILS_PARTITIONED)."""
+    load_dotenv()
+    return os.getenv("EMAILS_PARTITIONED", "false").lower() in ("1", "true", "yes")
+
+# Partitioned variant of the emails table. Unique constraints on a partitioned
+# table must include the partition key, so gmail_id is unique per date_received,
+# which is therefore NOT NULL (NULLs never conflict). Rows outside every month
+# partition go to emails_default until ensure_partitions splits them out.
+PARTITIONED_EMAILS_QUERIES = [
+    """
+    CREATE TABLE IF NOT EXISTS emails (
+        id BIGSERIAL,
+        gmail_id VARCHAR(255) NOT NULL,
+        thread_id VARCHAR(255),
+        sender VARCHAR(255),
+        subject TEXT,
+        messages TEXT,
+        date_received TIMESTAMP NOT NULL,
+        is_read BOOLEAN,
+        labels TEXT[],
+        sender_email VARCHAR(255),
+        sender_domain VARCHAR(255),
+        label_ids INTEGER[],
+        deleted_at TIMESTAMP,
+        UNIQUE (gmail_id, date_received)
+    ) PARTITION BY RANGE (date_received);
+    """,
+    "ALTER TABLE emails ALTER COLUMN date_received SET NOT NULL;",
+    "CREATE TABLE IF NOT EXISTS emails_default PARTITION OF emails DEFAULT;",
+    "CREATE INDEX IF NOT EXISTS idx_emails_gmail_id ON emails (gmail_id);",
+    "CREATE INDEX IF NOT EXISTS idx_emails_date_received ON emails (date_received);",
+]
+
+def _add_months(day, months):
+    """First day of the month `months` away from the month containing `day`."""
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def _is_partitioned(conn):
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('emails');"
+        )
+        return cur.fetchone() is not None
+
+def _emails_exists(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s);", ("emails",))
+        return cur.fetchone()[0] is not None
+
+def _check_emails_layout(partitioned):
+    """Raise when EMAILS_PARTITIONED disagrees with the existing emails table."""
+    if partitioned != partitioning_enabled():
+        raise RuntimeError(
+            f"EMAILS_PARTITIONED={os.getenv('EMAILS_PARTITIONED', 'false')} but the existing emails "
+            f"table is {'partitioned' if partitioned else 'not partitioned'}; the table is not "
+            f"converted, so set EMAILS_PARTITIONED to match it."
+        )
+
+_emails_partitioned = None
+
+def emails_partitioned():
+    """
+    Whether the live emails table is partitioned, looked up once per process.
+    Raises RuntimeError when EMAILS_PARTITIONED disagrees with the table.
+    """
+    global _emails_partitioned
+    if _emails_partitioned is None:
+        conn = get_connection()
+        try:
+            partitioned = _is_partitioned(conn)
+        finally:
+            conn.close()
+        _check_emails_layout(partitioned)
+        _emails_partitioned = partitioned
+    return _emails_partitioned
+
+def retention_cutoff():
+    """First month kept by EMAILS_RETENTION_MONTHS, or None when retention is off."""
+    load_dotenv()
+    retention_months = os.getenv("EMAILS_RETENTION_MONTHS")
+    if not retention_months:
+        return None
+    return _add_months(datetime.date.today(), -int(retention_months))
+
+def _create_month_partition(conn, name, start):
+    """
+    Create the partition for the month starting at `start`. Rows of that
+    month already sitting in emails_default are moved into it first, since
+    Postgres refuses to add a partition whose range the default still holds.
+    """
+    from psycopg2 import sql
+
+    end = _add_months(start, 1)
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM emails_default WHERE date_received >= %s AND date_received < %s LIMIT 1;",
+                (start, end)
+            )
+            if cur.fetchone() is None:
+                cur.execute(
+                    sql.SQL(
+                        "CREATE TABLE {} PARTITION OF emails FOR VALUES FROM (%s) TO (%s);"
+                    ).format(sql.Identifier(name)),
+                    (start, end)
+                )
+                return
+            cur.execute(sql.SQL("CREATE TABLE {} (LIKE emails INCLUDING DEFAULTS);").format(sql.Identifier(name)))
+            cur.execute(
+                sql.SQL(
+                    """
+                    WITH moved AS (
+                        DELETE FROM emails_default
+                        WHERE date_received >= %s AND date_received < %s
+                        RETURNING *
+                    )
+                    INSERT INTO {} SELECT * FROM moved;
+                    """
+                ).format(sql.Identifier(name)),
+                (start, end)
+            )
+            cur.execute(
+                sql.SQL("ALTER TABLE emails ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);").format(
+                    sql.Identifier(name)
+                ),
+                (start, end)
+            )
+    logger.info("[ensure_partitions] Moved rows of %s out of emails_default", name)
+
+def ensure_partitions(months_back=None, months_ahead=None, since=None, until=None):
+    """
+    Create the monthly partitions from `months_back` months ago up to
+    `months_ahead` months from now (EMAILS_PARTITION_MONTHS_BACK /
+    EMAILS_PARTITION_MONTHS_AHEAD), widened to cover [since, until) when a
+    load of older mail is about to start. Months outside that range that
+    already have rows in emails_default are split out too, so retention and
+    partition pruning reach them. Months before the retention cutoff are only
+    created to split such rows. Returns the names of new partitions.
+    """
+    import psycopg2
+
+    load_dotenv()
+    if months_back is None:
+        months_back = int(os.getenv("EMAILS_PARTITION_MONTHS_BACK", "24"))
+    if months_ahead is None:
+        months_ahead = int(os.getenv("EMAILS_PARTITION_MONTHS_AHEAD", "3"))
+
+    today = datetime.date.today()
+    first = _add_months(today, -months_back)
+    last = _add_months(today, months_ahead)
+    if since is not None:
+        first = min(first, _add_months(since, 0))
+    if until is not None:
+        last = max(last, _add_months(until - datetime.timedelta(days=1), 0))
+    cutoff = retention_cutoff()
+    if cutoff is not None:
+        first = max(first, cutoff)
+
+    created = []
+    conn = get_connection()
+    try:
+        if not _is_partitioned(conn):
+            logger.warning("[ensure_partitions] emails is not a partitioned table. Skipping.")
+            return created
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT DISTINCT date_trunc('month', date_received)::date FROM emails_default;"
+                )
+                months = {row[0] for row in cur.fetchall()}
+        start = first
+        while start <= last:
+            months.add(start)
+            start = _add_months(start, 1)
+
+        for start in sorted(months):
+            name = f"emails_p{start.year:04d}_{start.month:02d}"
+            try:
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT to_regclass(%s);", (name,))
+                        if cur.fetchone()[0] is not None:
+                            continue
+                _create_month_partition(conn, name, start)
+                created.append(name)
+            except psycopg2.Error as e:
+                logger.error("[ensure_partitions] Could not create partition %s: %s", name, e)
+    finally:
+        conn.close()
+
+    if created:
+        logger.info("[ensure_partitions] Created partitions: %s", ", ".join(created))
+    return created
+
+def apply_retention(retention_months, drop=False):
+    """
+    Detach monthly partitions that end before `retention_months` months ago.
+    Detached partitions stay behind as standalone archive tables unless
+    `drop` is set. Returns the names of the partitions removed from emails.
+    """
+    import psycopg2
+    from psycopg2 import sql
+
+    cutoff = _add_months(datetime.date.today(), -retention_months)
+    list_query = """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('emails');
+    """
+    removed = []
+    conn = get_connection()
+    try:
+        if not _is_partitioned(conn):
+            logger.warning("[apply_retention] emails is not a partitioned table. Skipping.")
+            return removed
+        with conn.cursor() as cur:
+            cur.execute(list_query)
+            names = sorted(row[0] for row in cur.fetchall())
+        for name in names:
+            match = PARTITION_NAME_PATTERN.match(name)
+            if not match:
+                continue
+            end = _add_months(datetime.date(int(match.group(1)), int(match.group(2)), 1), 1)
+            if end > cutoff:
+                continue
+            try:
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute(
+                            sql.SQL("ALTER TABLE emails DETACH PARTITION {};").format(sql.Identifier(name))
+                        )
+                        if drop:
+                            cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(name)))
+            except psycopg2.Error as e:
+                logger.error("[apply_retention] Could not remove partition %s: %s", name, e)
+                continue
+            removed.append(name)
+    finally:
+        conn.close()
+
+    if removed:
+        logger.info(
+            "[apply_retention] %s partitions: %s", "Dropped" if drop else "Archived", ", ".join(removed)
+        )
+    return removed
+
+def check_mailbox_account():
+    """
+    Bind the database to ACCOUNT_ID on first use and raise RuntimeError for
+    any other account: emails, labels and the queues hold one mailbox only.
+    """
+    load_dotenv()
+    account = os.getenv("ACCOUNT_ID", "default")
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO mailbox_account (account) VALUES (%s) ON CONFLICT (singleton) DO NOTHING;",
+                    (account,)
+                )
+                cur.execute("SELECT account FROM mailbox_account;")
+                row = cur.fetchone()
+    finally:
+        conn.close()
+    bound = row[0] if row else None
+    if bound is not None and bound != account:
+        raise RuntimeError(
+            f"This database belongs to ACCOUNT_ID '{bound}', not '{account}'. "
+            f"Each account needs its own database."
+        )
+
+def backfill_sender_columns(batch_size=5000):
+    """
+    Fill sender_email/sender_domain for rows stored before sender
+    normalization, parsing `sender` with the same parse_sender the sync
+    uses, batch_size rows per transaction. Rows holding an address that
+    parse_sender would never produce (e.g. 'addr@x.com (name)' from an
+    earlier SQL-only backfill) are parsed again. Runs once per database:
+    completion is recorded in schema_migrations, since the sync stores new
+    rows already parsed. Returns the rows updated.
+    """
+    from data_handler.email_processor import parse_sender
+
+    select_query = """
+        SELECT id, sender FROM emails
+        WHERE sender IS NOT NULL
+          AND (sender_email IS NULL OR sender_email ~ '[[:space:]()<>"]')
+          AND id > %s
+        ORDER BY id
+        LIMIT %s;
+    """
+    update_query = """
+        UPDATE emails AS e
+        SET sender_email = v.addr, sender_domain = v.domain
+        FROM unnest(%s::bigint[], %s::text[], %s::text[]) AS v(id, addr, domain)
+        WHERE e.id = v.id;
+    """
+    updated = 0
+    last_id = 0
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT EXISTS (SELECT 1 FROM schema_migrations WHERE name = %s);",
+                    (SENDER_BACKFILL_MIGRATION,)
+                )
+                if cur.fetchone()[0]:
+                    return 0
+        while True:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(select_query, (last_id, batch_size))
+                    rows = cur.fetchall()
+                    if not rows:
+                        break
+                    parsed = [(row_id, *parse_sender(sender)) for row_id, sender in rows]
+                    cur.execute(update_query, tuple(map(list, zip(*parsed))))
+            updated += len(rows)
+            last_id = rows[-1][0]
+        # Recorded only after the last batch, so an interrupted run resumes
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO schema_migrations (name) VALUES (%s) ON CONFLICT (name) DO NOTHING;",
+                    (SENDER_BACKFILL_MIGRATION,)
+                )
+    finally:
+        conn.close()
+
+    if updated:
+        logger.info("[backfill_sender_columns] Parsed the sender of %s emails", updated)
+    return updated
+
+@contextmanager
+def schema_lock():
+    """
+    Hold a session-level advisory lock for the duration of the block so only
+    one replica migrates the schema at a time. The others wait, then find
+    every statement already applied. Closing the connection releases it.
+    """
+    conn = get_connection()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s);", (SCHEMA_LOCK_KEY,))
+        yield
+    finally:
+        conn.close()
+
 def init_db():
-    """Initialize the database (create table if not exists)."""
+    """
+    Initialize the database (create table if not exists, apply migrations).
+    Replicas starting together run the migrations one after another.
+    """
+    if storage_backend() == "sqlite":
+        from db_client.sqlite_client import init_sqlite_db
+        init_sqlite_db()
+        return
+
+    with schema_lock():
+        _migrate_postgres()
+
+def _apply_once(cur, name, queries):
+    """Run `queries` unless schema_migrations already records `name`, and record it."""
+    cur.execute(
+        "INSERT INTO schema_migrations (name) VALUES (%s) ON CONFLICT (name) DO NOTHING RETURNING name;",
+        (name,)
+    )
+    if cur.fetchone() is None:
+        return
+    logger.info("[init_db] Applying one-time migration %s", name)
+    for query in queries:
+        cur.execute(query)
+
+def _migrate_postgres():
+
     create_table_query = """
     CREATE TABLE IF NOT EXISTS emails (
         id SERIAL PRIMARY KEY,
@@ -34,13 +582,39 @@ def init_db():
         messages TEXT,
         date_received TIMESTAMP,
         is_read BOOLEAN,
-        labels TEXT[]
+        labels TEXT[],
+        sender_email VARCHAR(255),
+        sender_domain VARCHAR(255),
+        label_ids INTEGER[],
+        deleted_at TIMESTAMP
     );
     """
     conn = get_connection()
     try:
+        if _emails_exists(conn):
+            _check_emails_layout(_is_partitioned(conn))
         with conn:
             with conn.cursor() as cur:
-                cur.execute(create_table_query)
+                if partitioning_enabled():
+                    for query in PARTITIONED_EMAILS_QUERIES:
+                        cur.execute(query)
+                else:
+                    cur.execute(create_table_query)
+                for query in SCHEMA_QUERIES:
+                    cur.execute(query)
+                for name, queries in ONE_TIME_MIGRATIONS:
+                    _apply_once(cur, name, queries)
     finally:
         conn.close()
+
+    check_mailbox_account()
+    backfill_sender_columns()
+
+    if partitioning_enabled():
+        ensure_partitions()
+        retention_months = os.getenv("EMAILS_RETENTION_MONTHS")
+        if retention_months:
+            apply_retention(
+                int(retention_months),
+                drop=os.getenv("EMAILS_RETENTION_DROP", "false").lower() in ("1", "true", "yes"),
+            )
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+_local = threading.local()
+
+SQLITE_SCHEMA_QUERIES = [
+    """
+    CREATE TABLE IF NOT EXISTS emails (
+        id INTEGER PRIMARY KEY,
+        gmail_id TEXT NOT NULL UNIQUE,
+        thread_id TEXT,
+        sender TEXT,
+        subject TEXT,
+        messages TEXT,
+        date_received TEXT,
+        is_read INTEGER,
+        labels TEXT,
+        sender_email TEXT,
+        sender_domain TEXT,
+        deleted_at TEXT
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_emails_sender_email ON emails (sender_email);",
+    "CREATE INDEX IF NOT EXISTS idx_emails_sender_domain ON emails (sender_domain);",
+    "CREATE INDEX IF NOT EXISTS idx_emails_date_received ON emails (date_received);",
+    """
+    CREATE TABLE IF NOT EXISTS labels (
+        id INTEGER PRIMARY KEY,
+        gmail_label_id TEXT NOT NULL UNIQUE,
+        name TEXT NOT NULL
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_labels_name ON labels (name COLLATE NOCASE);",
+    # SQLite has no arrays; email -> label membership lives in a junction table
+    """
+    CREATE TABLE IF NOT EXISTS email_labels (
+        label_id INTEGER NOT NULL REFERENCES labels (id) ON DELETE CASCADE,
+        email_id INTEGER NOT NULL REFERENCES emails (id) ON DELETE CASCADE,
+        PRIMARY KEY (label_id, email_id)
+    ) WITHOUT ROWID;
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_email_labels_email ON email_labels (email_id);",
+    # Trigram FTS5 index answers substring (contains) rules without scanning
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+        sender, subject, messages,
+        content='emails', content_rowid='id', tokenize='trigram'
+    );
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS emails_fts_insert AFTER INSERT ON emails BEGIN
+        INSERT INTO emails_fts (rowid, sender, subject, messages)
+        VALUES (new.id, new.sender, new.subject, new.messages);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS emails_fts_delete AFTER DELETE ON emails BEGIN
+        INSERT INTO emails_fts (emails_fts, rowid, sender, subject, messages)
+        VALUES ('delete', old.id, old.sender, old.subject, old.messages);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS emails_fts_update AFTER UPDATE OF sender, subject, messages ON emails BEGIN
+        INSERT INTO emails_fts (emails_fts, rowid, sender, subject, messages)
+        VALUES ('delete', old.id, old.sender, old.subject, old.messages);
+        INSERT INTO emails_fts (rowid, sender, subject, messages)
+        VALUES (new.id, new.sender, new.subject, new.messages);
+    END;
+    """,
+]
+
+
+def get_sqlite_connection(shared=True):
+    """
+    Return a connection to the SQLITE_PATH database in WAL mode.
+    By default the connection is cached per thread so repeated small queries
+    skip the connect cost; pass shared=False for a dedicated connection
+    (e.g. a long-running read alongside writes).
+    """
+    if shared and getattr(_local, "conn", None) is not None:
+        return _local.conn
+
+    load_dotenv()
+    conn = sqlite3.connect(os.getenv("SQLITE_PATH", "emails.db"), timeout=30)
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute("PRAGMA foreign_keys = ON;")
+    if shared:
+        _local.conn = conn
+    return conn
+
+
+def init_sqlite_db():
+    """Initialize the SQLite database (create tables, indexes and FTS if not exists)."""
+    conn = get_sqlite_connection()
+    with conn:
+        for query in SQLITE_SCHEMA_QUERIES:
+            conn.execute(query)
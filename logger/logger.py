@@ -13,8 +13,8 @@ def get_logger(name=__name__, log_file='app.log'):
             '%(asctime)s — %(name)s — %(levelname)s — %(message)s'
         )
 
-        # File handler
-        file_handler = logging.FileHandler(log_file)
+        # File handler; the file is only opened on the first record
+        file_handler = logging.FileHandler(log_file, delay=True)
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
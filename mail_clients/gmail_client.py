@@ -1,8 +1,5 @@
 import os
 import pickle
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 from dotenv import load_dotenv
 
 from logger.logger import get_logger
@@ -12,6 +9,11 @@ logger = get_logger(__name__,"logs/gmail_client")
 SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
 
 def get_gmail_service():
+    # The Google client stack is slow to import; only pay for it when a service is needed
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+    from googleapiclient.discovery import build
+
     try:
         load_dotenv()
 
@@ -0,0 +1,67 @@
+import re
+
+# Gmail search operator for each text field; message bodies use a bare term
+SEARCH_OPERATORS = {
+    'from': 'from:',
+    'from domain': 'from:',
+    'subject': 'subject:',
+    'message': '',
+}
+
+
+def _quote(value):
+    value = value.replace('"', '').strip()
+    return f'"{value}"' if re.search(r"[\s(){}]", value) else value
+
+
+def _translate_rule(rule):
+    """Return the Gmail search term for one rule, or None if it has no equivalent."""
+    field = rule['field'].lower()
+    operator = rule['predicate'].lower()
+    value = str(rule['value'])
+
+    if field in SEARCH_OPERATORS:
+        # Gmail only does word matching, so exact equality is limited to addresses
+        if operator in ['equals', 'does not equal'] and not field.startswith('from'):
+            return None
+        if operator not in ['contains', 'does not contain', 'equals', 'does not equal']:
+            return None
+        term = f"{SEARCH_OPERATORS[field]}{_quote(value)}"
+        return f"-{term}" if 'not' in operator else term
+
+    if field in ['received date', 'received date/time'] and operator in ['less than', 'greater than']:
+        days = re.findall(r"(\d+)\s*days?", value)
+        if not days:
+            return None
+        return f"{'newer_than' if 'less' in operator else 'older_than'}:{int(days[0])}d"
+
+    if field == 'label' and operator in ['has', 'does not have']:
+        term = f"label:{_quote(value)}"
+        return f"-{term}" if 'not' in operator else term
+
+    return None
+
+
+def build_gmail_query(rules: list, predicate: str) -> str:
+    """
+    Translate rules into a Gmail search (`q`) string. "All" joins the terms
+    with Gmail's implicit AND, "Any" wraps them in an OR group `{...}`.
+    Raises ValueError listing every rule that cannot be expressed in Gmail search.
+    """
+    terms = []
+    unsupported = []
+    for rule in rules:
+        term = _translate_rule(rule)
+        if term is None:
+            unsupported.append(f"{rule['field']} {rule['predicate']} {rule['value']}")
+        else:
+            terms.append(term)
+
+    if unsupported:
+        raise ValueError(f"Rules cannot be translated to a Gmail search: {'; '.join(unsupported)}")
+    if not terms:
+        raise ValueError("No rules to translate to a Gmail search")
+
+    if predicate.lower() == "all" or len(terms) == 1:
+        return " ".join(terms)
+    return "{" + " ".join(terms) + "}"
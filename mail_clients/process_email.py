@@ -1,32 +1,112 @@
 
 from .gmail_client import get_gmail_service
+from concurrent.futures import ThreadPoolExecutor
 from email.utils import parsedate_to_datetime
-from data_handler.email_processor import EmailRepository
-from googleapiclient.errors import HttpError
+import datetime
+import itertools
+from data_handler.email_processor import EmailRepository, parse_sender
+from data_handler.backfill_checkpoint import BackfillCheckpointRepository
+from data_handler.repository import get_email_repository
+from db_client.db_client import (
+    emails_partitioned, ensure_partitions, partitioning_enabled, retention_cutoff, storage_backend
+)
 from logger.logger import get_logger
 
 logger = get_logger(__name__,"logs/process_email")
 
-def fetch_and_store_emails():
+def _store_message(service, msg_id, repository):
+    """
+    Fetches one message's metadata and upserts it through `repository`.
+    Returns the repository's insert_or_update_email result.
+    """
+    logger.debug("[_store_message] Processing message with id=%s", msg_id)
+    
+    msg_detail = service.users().messages().get(
+        userId='me',
+        id=msg_id,
+        format='metadata'
+    ).execute()
+
+    gmail_id = msg_detail['id']
+    thread_id = msg_detail.get('threadId')
+    headers = msg_detail.get('payload', {}).get('headers', [])
+    snippet = msg_detail.get('snippet', '')
+    label_ids = msg_detail.get('labelIds', [])
+
+    subject = None
+    sender = None
+    date_received = None
+
+    for h in headers:
+        name = h['name'].lower()
+        if name == 'subject':
+            subject = h['value']
+        elif name == 'from':
+            sender = h['value']
+        elif name == 'date':
+            date_received = parsedate_to_datetime(h['value'])
+
+    if date_received is None and msg_detail.get('internalDate'):
+        date_received = datetime.datetime.fromtimestamp(
+            int(msg_detail['internalDate']) / 1000, tz=datetime.timezone.utc
+        )
+
+    is_read = 'UNREAD' not in label_ids
+    sender_email, sender_domain = parse_sender(sender)
+
+    email_record = {
+        "gmail_id": gmail_id,
+        "thread_id": thread_id,
+        "sender": sender,
+        "sender_email": sender_email,
+        "sender_domain": sender_domain,
+        "subject": subject,
+        "messages": snippet,
+        "date_received": date_received,
+        "is_read": is_read,
+        "labels": label_ids,
+    }
+
+    return repository.insert_or_update_email(email_record)
+
+
+def _retention_query():
+    """Gmail search bound skipping mail older than the retention cutoff, or None."""
+    cutoff = retention_cutoff() if partitioning_enabled() else None
+    return f"after:{cutoff:%Y/%m/%d}" if cutoff else None
+
+
+def fetch_and_store_emails(stop=None):
     """
     Fetches emails from Gmail and stores/updates them in the DB.
     """
+    from googleapiclient.errors import HttpError
 
     service = get_gmail_service()
     if not service:
         logger.error("[fetch_and_store_emails] Gmail service was not created successfully.")
         return
 
+    repository = get_email_repository()
+    # Mail past retention would only refill emails_default
+    query = _retention_query()
     page_token = None
     processed_count = 0
     updated_count = 0
     new_count = 0
 
     try:
+        labels_response = service.users().labels().list(userId='me').execute()
+        repository.upsert_labels(labels_response.get('labels', []))
+
         while True:
+            if stop and stop.is_set():
+                logger.warning("[fetch_and_store_emails] Lease lost. Stopping the sync.")
+                break
             response = service.users().messages().list(
                 userId='me',
-                maxResults=5,  
+                q=query,
+                maxResults=5,
                 pageToken=page_token
             ).execute()
             
@@ -36,54 +116,14 @@ def fetch_and_store_emails():
                 logger.info("[fetch_and_store_emails] No messages found. Breaking out of the loop.")
                 break
 
-            for msg in messages:
-                msg_id = msg['id']
-                logger.debug("[fetch_and_store_emails] Processing message with id=%s", msg_id)
-                
-                msg_detail = service.users().messages().get(
-                    userId='me',
-                    id=msg_id,
-                    format='metadata'
-                ).execute()
-
-                gmail_id = msg_detail['id']
-                thread_id = msg_detail.get('threadId')
-                headers = msg_detail.get('payload', {}).get('headers', [])
-                snippet = msg_detail.get('snippet', '')
-                label_ids = msg_detail.get('labelIds', [])
-
-                subject = None
-                sender = None
-                date_received = None
-
-                for h in headers:
-                    name = h['name'].lower()
-                    if name == 'subject':
-                        subject = h['value']
-                    elif name == 'from':
-                        sender = h['value']
-                    elif name == 'date':
-                        date_received = parsedate_to_datetime(h['value'])
-
-                is_read = 'UNREAD' not in label_ids
-
-                email_record = {
-                    "gmail_id": gmail_id,
-                    "thread_id": thread_id,
-                    "sender": sender,
-                    "subject": subject,
-                    "messages": snippet,
-                    "date_received": date_received,
-                    "is_read": is_read,
-                    "labels": label_ids,
-                }
-
-                result = EmailRepository.insert_or_update_email(email_record)
-                processed_count += 1
-                if result == "created":
-                    new_count += 1
-                elif result == 'updated':
-                    updated_count += 1
+            with repository.transaction():
+                for msg in messages:
+                    result = _store_message(service, msg['id'], repository)
+                    processed_count += 1
+                    if result == "created":
+                        new_count += 1
+                    elif result == 'updated':
+                        updated_count += 1
 
             page_token = response.get('nextPageToken')
             if not page_token:
@@ -97,3 +137,224 @@ def fetch_and_store_emails():
 
     except HttpError as error:
         logger.error("An error occurred: %s", error)
+
+
+def _iter_gmail_message_ids(service, page_size=500):
+    """Yield the id of every message in the mailbox, one list page at a time."""
+    page_token = None
+    while True:
+        response = service.users().messages().list(
+            userId='me',
+            maxResults=page_size,
+            pageToken=page_token,
+            fields='messages/id,nextPageToken'
+        ).execute()
+        for msg in response.get('messages', []):
+            yield msg['id']
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+
+def reconcile_deleted_emails(purge=False, batch_size=1000, stop=None):
+    """
+    Tombstones (or purges) stored emails whose messages no longer exist in Gmail,
+    batch_size at a time. Returns the rows reclaimed, or None if Gmail could not be listed.
+    """
+    from googleapiclient.errors import HttpError
+
+    service = get_gmail_service()
+    if not service:
+        logger.error("[reconcile_deleted_emails] Gmail service was not created successfully.")
+        return None
+
+    repository = get_email_repository()
+    reclaimed = 0
+    # Nothing is yielded, so nothing is deleted, unless the full listing succeeded.
+    missing_ids = repository.iter_missing_gmail_ids(_iter_gmail_message_ids(service), include_deleted=purge)
+    try:
+        while True:
+            missing = list(itertools.islice(missing_ids, batch_size))
+            if not missing:
+                break
+            if stop and stop.is_set():
+                logger.warning("[reconcile_deleted_emails] Lease lost. Stopping the reconciliation.")
+                return reclaimed
+            reclaimed += repository.tombstone_emails(missing, purge=purge)
+    except HttpError as error:
+        logger.error("[reconcile_deleted_emails] Could not list Gmail messages: %s", error)
+        return None
+
+    logger.info(
+        f"[reconcile_deleted_emails] Reconciliation completed. "
+        f"{'Purged' if purge else 'Soft-deleted'}: {reclaimed}"
+    )
+    return reclaimed
+
+
+def _window_query(window_start, window_end):
+    """Gmail search for messages received in [window_start, window_end) (epoch seconds)."""
+    return f"after:{window_start} before:{window_end}"
+
+
+def _plan_backfill_windows(service, start, end, windows, samples):
+    """
+    Splits [start, end) into at most `windows` contiguous date windows holding
+    roughly the same number of messages, using Gmail's resultSizeEstimate for
+    `samples` equal-length slices.
+    """
+    step = max(1, (end - start) // samples)
+    edges = list(range(start, end, step)) + [end]
+    slices = []
+    for slice_start, slice_end in zip(edges, edges[1:]):
+        response = service.users().messages().list(
+            userId='me',
+            q=_window_query(slice_start, slice_end),
+            maxResults=1,
+            fields='resultSizeEstimate'
+        ).execute()
+        slices.append((slice_start, slice_end, response.get('resultSizeEstimate', 0)))
+
+    total = sum(estimate for _, _, estimate in slices)
+    if not total:
+        return [(start, end)]
+
+    # Cut at the slice edge nearest to each k/windows quantile of the estimates
+    planned = []
+    window_start = start
+    cumulative = 0
+    k = 1
+    for slice_start, slice_end, estimate in slices:
+        boundary = k * total / windows
+        if (k < windows and window_start < slice_start and cumulative + estimate > boundary
+                and boundary - cumulative < cumulative + estimate - boundary):
+            planned.append((window_start, slice_start))
+            window_start = slice_start
+            k += 1
+        cumulative += estimate
+        if k < windows and cumulative >= k * total / windows:
+            planned.append((window_start, slice_end))
+            window_start = slice_end
+            while k < windows and cumulative >= k * total / windows:
+                k += 1
+    if window_start < end:
+        planned.append((window_start, end))
+
+    logger.info(f"[_plan_backfill_windows] ~{total} messages split into {len(planned)} windows")
+    return planned
+
+
+def _backfill_window(run_key, window, page_size, stop=None):
+    """
+    Lists and stores every message of one window, checkpointing the page
+    token after each page so an interrupted run resumes where it stopped.
+    Each window uses its own Gmail service, as the client is not thread-safe.
+    """
+    from googleapiclient.errors import HttpError
+
+    counts = {"processed": 0, "new": 0, "updated": 0}
+    if window['status'] == 'done':
+        return counts
+
+    service = get_gmail_service()
+    if not service:
+        logger.error("[_backfill_window] Gmail service was not created successfully.")
+        return counts
+
+    window_start = window['window_start']
+    page_token = window.get('page_token')
+    processed = window.get('processed', 0)
+    try:
+        while True:
+            if stop and stop.is_set():
+                logger.warning("[_backfill_window] Lease lost. Leaving window %s for a resume.", window_start)
+                break
+            response = service.users().messages().list(
+                userId='me',
+                q=_window_query(window_start, window['window_end']),
+                maxResults=page_size,
+                pageToken=page_token
+            ).execute()
+
+            for msg in response.get('messages', []):
+                result = _store_message(service, msg['id'], EmailRepository)
+                counts["processed"] += 1
+                if result == "created":
+                    counts["new"] += 1
+                elif result == 'updated':
+                    counts["updated"] += 1
+
+            processed += len(response.get('messages', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                BackfillCheckpointRepository.save_checkpoint(run_key, window_start, None, processed, 'done')
+                break
+            BackfillCheckpointRepository.save_checkpoint(run_key, window_start, page_token, processed, 'pending')
+    except HttpError as error:
+        logger.error("[_backfill_window] Window starting at %s failed: %s", window_start, error)
+
+    return counts
+
+
+def backfill_emails(since, until=None, windows=8, workers=4, samples=64, page_size=100, stop=None):
+    """
+    Imports the mailbox between the `since` and `until` dates (until defaults
+    to tomorrow) by splitting it into date windows that are listed and stored
+    concurrently. Re-running with the same arguments resumes from the saved
+    per-window checkpoints; the run is keyed on the arguments as given, so an
+    open-ended run keeps the end date it was planned with.
+    """
+    from googleapiclient.errors import HttpError
+
+    if storage_backend() != "postgres":
+        logger.error("[backfill_emails] Backfill checkpoints require the postgres storage backend.")
+        return None
+
+    # Keyed before defaults are resolved so a later re-run finds the same plan
+    run_key = f"{since.isoformat()}:{until.isoformat() if until else 'open'}"
+    until = until or datetime.date.today() + datetime.timedelta(days=1)
+    if emails_partitioned():
+        # Older mail would be detached by retention anyway
+        cutoff = retention_cutoff()
+        if cutoff is not None and since < cutoff:
+            logger.info(f"[backfill_emails] Starting at the retention cutoff {cutoff} instead of {since}")
+            since = cutoff
+        ensure_partitions(since=since, until=until)
+
+    service = get_gmail_service()
+    if not service:
+        logger.error("[backfill_emails] Gmail service was not created successfully.")
+        return None
+
+    try:
+        labels_response = service.users().labels().list(userId='me').execute()
+        EmailRepository.upsert_labels(labels_response.get('labels', []))
+
+        planned = BackfillCheckpointRepository.get_windows(run_key)
+        if not planned:
+            start = int(datetime.datetime.combine(since, datetime.time(), datetime.timezone.utc).timestamp())
+            end = int(datetime.datetime.combine(until, datetime.time(), datetime.timezone.utc).timestamp())
+            created = BackfillCheckpointRepository.create_windows(
+                run_key, _plan_backfill_windows(service, start, end, windows, samples)
+            )
+            planned = BackfillCheckpointRepository.get_windows(run_key) if created else []
+            if not planned:
+                logger.error(f"[backfill_emails] Could not save the window plan of backfill {run_key}.")
+                return None
+        else:
+            logger.info(f"[backfill_emails] Resuming backfill {run_key}")
+    except HttpError as error:
+        logger.error("[backfill_emails] Could not plan backfill windows: %s", error)
+        return None
+
+    totals = {"processed": 0, "new": 0, "updated": 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for counts in executor.map(lambda w: _backfill_window(run_key, w, page_size, stop), planned):
+            for key in totals:
+                totals[key] += counts[key]
+
+    logger.info(
+        f"[backfill_emails] Backfill {run_key} completed. Processed: {totals['processed']}, "
+        f"New: {totals['new']}, Updated: {totals['updated']}"
+    )
+    return totals
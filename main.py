@@ -1,16 +1,7 @@
-import psycopg2
-from dotenv import load_dotenv
-import os
-from db_client.db_client import init_db
-from mail_clients.gmail_client import get_gmail_service
-from mail_clients.process_email import fetch_and_store_emails
+import sys
 
-def main():
-    load_dotenv()
-    init_db()
-    fetch_and_store_emails()
+from cli import main
 
-    
 
 if __name__ == "__main__":
-    main()
+    main(["sync", *sys.argv[1:]])
@@ -1,9 +1,12 @@
 from dotenv import load_dotenv
 import os
 import json
-from data_handler.email_processor import EmailRepository
+import sys
+from data_handler.repository import get_email_repository
+from db_client.db_client import storage_backend
+from data_handler.action_queue import ActionQueueRepository
 from mail_clients.gmail_client import get_gmail_service
-import datetime
+from mail_clients.gmail_query import build_gmail_query
 
 from logger.logger import get_logger
 
@@ -11,9 +14,16 @@ from logger.logger import get_logger
 logger = get_logger(__name__,"logs/process_rules")
 
 
-def apply_rules():
+def apply_rules(enqueue_only=False, on_gmail=False, dry_run=False, rules_file=None, stop=None):
+    """
+    Match emails against the rules and queue their actions in the
+    email_actions outbox. Unless enqueue_only is set, the queue is then
+    drained in-process; otherwise it is left for action_worker.py.
+    With on_gmail, the rules run directly against Gmail search instead.
+    With dry_run, matches are only logged. rules_file defaults to RULES_JSON_PATH.
+    """
     load_dotenv()
-    rules_file = os.getenv("RULES_JSON_PATH")
+    rules_file = rules_file or os.getenv("RULES_JSON_PATH")
     if not rules_file:
         logger.info("[apply_rules] No rules found. Exiting.")
         return
@@ -25,15 +35,142 @@ def apply_rules():
     rules = rules_data.get("rules", [])
     actions = rules_data.get("actions", [])
 
-    emails = EmailRepository.get_emails_by_conditions(rules, top_level_predicate)
+    if on_gmail and dry_run:
+        try:
+            logger.info(f"[apply_rules] Dry run. Gmail query: {build_gmail_query(rules, top_level_predicate)}")
+        except ValueError as e:
+            logger.error(f"[apply_rules] Dry run. {e}")
+        return
+    if on_gmail:
+        apply_rules_on_gmail(rules, top_level_predicate, actions, stop=stop)
+        return
+
+    emails = get_email_repository().get_emails_by_conditions(rules, top_level_predicate)
     logger.debug(f"[apply_rules] Found {len(emails)} matching emails")
 
+    if dry_run:
+        for email in emails:
+            logger.info(f"[apply_rules] Dry run. Would apply {actions} to email {email['gmail_id']}")
+        return
+
+    # The outbox lives in Postgres; embedded deployments act inline
+    if storage_backend() != "postgres":
+        service = get_gmail_service()
+        for email in emails:
+            if stop and stop.is_set():
+                logger.warning("[apply_rules] Lease lost. Stopping.")
+                return
+            logger.debug(f"[apply_rules] Performing actions on email {email['gmail_id']}")
+            for action in actions:
+                perform_action(service, email, action)
+        return
+
+    queued = ActionQueueRepository.enqueue_actions([email['gmail_id'] for email in emails], actions)
+    logger.info(f"[apply_rules] Enqueued {queued} actions")
+
+    if not enqueue_only:
+        drain_action_queue(
+            batch_size=int(os.getenv("ACTION_WORKER_BATCH_SIZE", "50")),
+            max_attempts=int(os.getenv("ACTION_MAX_ATTEMPTS", "5")),
+            stop=stop,
+        )
+
+
+def apply_rules_on_gmail(rules, predicate, actions, stop=None):
+    """
+    Run the rules as a Gmail search and perform the actions on every match,
+    without requiring the mailbox to be synced or a database at all. Rules
+    that Gmail search cannot express are rejected before anything is listed.
+    Every match is listed before any action runs, as the actions can change
+    which messages the same search returns.
+    """
+    try:
+        query = build_gmail_query(rules, predicate)
+    except ValueError as e:
+        logger.error(f"[apply_rules_on_gmail] {e}")
+        return 0
+    logger.info(f"[apply_rules_on_gmail] Searching Gmail with q='{query}'")
+
     service = get_gmail_service()
+    if not service:
+        logger.error("[apply_rules_on_gmail] Gmail service was not created successfully.")
+        return 0
 
-    for email in emails:
-        logger.debug(f"[apply_rules] Performing actions on email {email['gmail_id']}")
+    message_ids = []
+    page_token = None
+    while True:
+        response = service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=500,
+            pageToken=page_token
+        ).execute()
+        message_ids.extend(msg['id'] for msg in response.get('messages', []))
+
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+    matched = 0
+    for message_id in message_ids:
+        if stop and stop.is_set():
+            logger.warning("[apply_rules_on_gmail] Lease lost. Stopping.")
+            break
+        detail = service.users().messages().get(
+            userId='me',
+            id=message_id,
+            format='minimal'
+        ).execute()
+        label_ids = detail.get('labelIds', [])
+        email = {
+            "gmail_id": message_id,
+            "is_read": 'UNREAD' not in label_ids,
+            "labels": label_ids,
+        }
         for action in actions:
-            perform_action(service, email, action)
+            perform_action(service, email, action, write_back=False)
+        matched += 1
+
+    logger.info(f"[apply_rules_on_gmail] Applied actions to {matched} emails")
+    return matched
+
+
+def drain_action_queue(service=None, batch_size=50, max_attempts=5, stop=None):
+    """
+    Claim batches from the email_actions outbox and perform them against
+    Gmail until no claimable work is left, or until the `stop` Event is set.
+    Safe to run from several processes or hosts at once. Returns the number
+    of actions completed.
+    """
+    service = service or get_gmail_service()
+    if not service:
+        logger.error("[drain_action_queue] Gmail service was not created successfully.")
+        return 0
+
+    completed = 0
+    while not (stop and stop.is_set()):
+        batch = ActionQueueRepository.claim_batch(batch_size, max_attempts)
+        if not batch:
+            break
+
+        done_ids = []
+        for job in batch:
+            logger.debug(f"[drain_action_queue] Performing '{job['action']}' on email {job['gmail_id']}")
+            try:
+                email = get_email_repository().get_email_by_gmail_id(job['gmail_id'])
+                if email is None:
+                    raise LookupError(f"email {job['gmail_id']} not found")
+                perform_action(service, email, job['action'])
+                done_ids.append(job['id'])
+            except Exception as e:
+                logger.error(f"[drain_action_queue] Action {job['id']} failed (attempt {job['attempts']}): {e}")
+                ActionQueueRepository.mark_failed(job['id'], str(e), max_attempts)
+
+        ActionQueueRepository.mark_done(done_ids)
+        completed += len(done_ids)
+
+    logger.info(f"[drain_action_queue] Completed {completed} actions")
+    return completed
 
 
 def mark_as_read(service, message_id):
@@ -52,10 +189,11 @@ def mark_as_unread(service, message_id):
     ).execute()
 
 
-def move_to_label(service, email, label_name):
+def move_to_label(service, email, label_name, write_back=True):
     """
     Moves the message to the specified label (if the label exists).
-    If it doesn't exist, create it.
+    If it doesn't exist, create it. With write_back, the local copy of the
+    email and the label dimension are updated as well.
     """
     message_id = email["gmail_id"]
     labels_response = service.users().labels().list(userId='me').execute()
@@ -72,6 +210,8 @@ def move_to_label(service, email, label_name):
             body={'name': label_name}
         ).execute()
         label_id = new_label['id']
+    if write_back:
+        get_email_repository().upsert_labels([{'id': label_id, 'name': label_name}])
 
     service.users().messages().modify(
         userId='me',
@@ -81,12 +221,14 @@ def move_to_label(service, email, label_name):
 
     if "labels" not in email or email["labels"] is None:
         email["labels"] = []
-    email["labels"].append(label_name) 
-    EmailRepository.update_email(email)
+    if label_id not in email["labels"]:
+        email["labels"].append(label_id)
+    if write_back:
+        get_email_repository().add_label(message_id, label_id)
     logger.info(f"[move_to_label] Email {message_id} moved to label '{label_name}'.")
 
 
-def perform_action(service, email, action):
+def perform_action(service, email, action, write_back=True):
     gmail_id = email['gmail_id']
     action_lower = action.lower()
 
@@ -96,7 +238,9 @@ def perform_action(service, email, action):
             logger.info(f"[perform_action] Marking email {gmail_id} as read.")
             mark_as_read(service, gmail_id)
             email["is_read"] = True
-            EmailRepository.update_email(email)
+            email["labels"] = [label for label in email.get("labels") or [] if label != "UNREAD"]
+            if write_back:
+                get_email_repository().set_read(gmail_id, True)
         else:
             logger.debug(f"[perform_action Email {gmail_id} is already marked as read. Skipping...")
 
@@ -106,7 +250,9 @@ def perform_action(service, email, action):
             logger.info(f"[perform_action] Marking email {gmail_id} as unread.")
             mark_as_unread(service, gmail_id)
             email["is_read"] = False
-            EmailRepository.update_email(email)
+            email["labels"] = [label for label in email.get("labels") or [] if label != "UNREAD"] + ["UNREAD"]
+            if write_back:
+                get_email_repository().set_read(gmail_id, False)
         else:
             logger.debug(f"[perform_action] Email {gmail_id} is already unread. Skipping...")
 
@@ -116,8 +262,9 @@ def perform_action(service, email, action):
         if len(parts) == 2:
             label_name = parts[1].strip()
             logger.info(f"[perform_action] Moving email {gmail_id} to label '{label_name}'.")
-            move_to_label(service, email, label_name)
+            move_to_label(service, email, label_name, write_back)
 
 
 if __name__ == "__main__":
-    apply_rules()
\ No newline at end of file
+    from cli import main
+    main(["apply-rules", *sys.argv[1:]])
\ No newline at end of file
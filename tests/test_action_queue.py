@@ -0,0 +1,81 @@
+import pytest
+from data_handler.action_queue import ActionQueueRepository
+import data_handler.action_queue as aq_mod
+
+class DummyCursor:
+    def __init__(self, rows=None, description=None, rowcount=0):
+        self._rows = rows or []
+        self._description = description or []
+        self.rowcount = rowcount
+        self.queries = []
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+    def fetchall(self):
+        return self._rows
+    @property
+    def description(self):
+        return self._description
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+class DummyConnection:
+    def __init__(self, cursor):
+        self.cursor_obj = cursor
+        self.closed = False
+    def cursor(self):
+        return self.cursor_obj
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        pass
+    def close(self):
+        self.closed = True
+
+def test_enqueue_actions(monkeypatch):
+    dummy_cursor = DummyCursor(rowcount=4)
+    dummy_conn = DummyConnection(dummy_cursor)
+    monkeypatch.setattr(aq_mod, 'get_connection', lambda: dummy_conn)
+
+    assert ActionQueueRepository.enqueue_actions(['a', 'b'], ['Mark as read', 'Move Message : X']) == 4
+    query, params = dummy_cursor.queries[0]
+    assert 'ON CONFLICT (gmail_id, action)' in query
+    assert params == (['a', 'b'], ['Mark as read', 'Move Message : X'])
+    assert dummy_conn.closed
+
+def test_enqueue_actions_empty(monkeypatch):
+    monkeypatch.setattr(aq_mod, 'get_connection', lambda: pytest.fail('should not connect'))
+    assert ActionQueueRepository.enqueue_actions([], ['Mark as read']) == 0
+
+def test_claim_batch_skips_locked(monkeypatch):
+    rows = [(1, 'a', 'Mark as read', 1)]
+    desc = [('id',), ('gmail_id',), ('action',), ('attempts',)]
+    dummy_cursor = DummyCursor(rows=rows, description=desc)
+    monkeypatch.setattr(aq_mod, 'get_connection', lambda: DummyConnection(dummy_cursor))
+
+    batch = ActionQueueRepository.claim_batch(10)
+    query, params = dummy_cursor.queries[1]
+    assert 'FOR UPDATE SKIP LOCKED' in query
+    assert params == ('15 MINUTES', 5, 10)
+    assert batch == [{'id': 1, 'gmail_id': 'a', 'action': 'Mark as read', 'attempts': 1}]
+
+def test_claim_batch_fails_abandoned_actions_at_max_attempts(monkeypatch):
+    dummy_cursor = DummyCursor(description=[('id',)])
+    monkeypatch.setattr(aq_mod, 'get_connection', lambda: DummyConnection(dummy_cursor))
+
+    ActionQueueRepository.claim_batch(10, max_attempts=3)
+    expire_query, expire_params = dummy_cursor.queries[0]
+    assert "SET status = 'failed'" in expire_query
+    assert 'attempts >= %s' in expire_query
+    assert expire_params == ('15 MINUTES', 3)
+    assert 'attempts < %s' in dummy_cursor.queries[1][0]
+
+def test_mark_failed(monkeypatch):
+    dummy_cursor = DummyCursor()
+    monkeypatch.setattr(aq_mod, 'get_connection', lambda: DummyConnection(dummy_cursor))
+
+    ActionQueueRepository.mark_failed(3, 'boom', 5)
+    query, params = dummy_cursor.queries[0]
+    assert "THEN 'failed' ELSE 'pending'" in query
+    assert params == (5, 'boom', 3)
@@ -0,0 +1,41 @@
+import pytest
+import cli
+import process_rules as pr_mod
+
+def test_apply_rules_subcommand_passes_flags(monkeypatch):
+    calls = []
+    monkeypatch.setattr(pr_mod, 'apply_rules', lambda **kwargs: calls.append(kwargs))
+
+    cli.main(['apply-rules', '--dry-run', '--gmail', '--rules', 'r.json'])
+    stop = calls[0].pop('stop')
+    assert calls == [{'enqueue_only': False, 'on_gmail': True, 'dry_run': True, 'rules_file': 'r.json'}]
+    assert not stop.is_set()
+
+def test_worker_subcommand_reads_env_defaults(monkeypatch):
+    import db_client.db_client as db_mod
+    checked = []
+    monkeypatch.setattr(db_mod, 'storage_backend', lambda: 'postgres')
+    monkeypatch.setattr(db_mod, 'check_mailbox_account', lambda: checked.append(True))
+    calls = []
+    monkeypatch.setattr(pr_mod, 'drain_action_queue', lambda **kwargs: calls.append(kwargs))
+    monkeypatch.setenv('ACTION_WORKER_BATCH_SIZE', '7')
+
+    cli.main(['worker', '--max-attempts', '2'])
+    assert calls == [{'batch_size': 7, 'max_attempts': 2}]
+    assert checked == [True]
+
+def test_unknown_subcommand_exits():
+    with pytest.raises(SystemExit):
+        cli.main(['nope'])
+
+def test_reconcile_skips_when_lease_is_held(monkeypatch):
+    import db_client.db_client as db_mod
+    import data_handler.lease as lease_mod
+    import mail_clients.process_email as pe_mod
+
+    monkeypatch.setattr(db_mod, 'init_db', lambda: None)
+    monkeypatch.setattr(db_mod, 'storage_backend', lambda: 'postgres')
+    monkeypatch.setattr(lease_mod.LeaseRepository, 'acquire', lambda *args: False)
+    monkeypatch.setattr(pe_mod, 'reconcile_deleted_emails', lambda purge: pytest.fail('lease is held elsewhere'))
+
+    cli.main(['reconcile'])
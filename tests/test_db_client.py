@@ -9,6 +9,10 @@ class DummyCursor:
         self.queries = []
     def execute(self, query, params=None):
         self.queries.append((query, params))
+    def fetchone(self):
+        return (None,)
+    def fetchall(self):
+        return []
     def __enter__(self):
         return self
     def __exit__(self, exc_type, exc, tb):
@@ -31,6 +35,7 @@ class DummyConnection:
 def patch_psycopg_connect(monkeypatch):
     # Prevent loading .env
     monkeypatch.setattr(db_mod, 'load_dotenv', lambda: None)
+    monkeypatch.setattr(db_mod, '_emails_partitioned', None)
     # Set env vars for get_connection
     monkeypatch.setenv('DB_NAME', 'testdb')
     monkeypatch.setenv('DB_USER', 'user')
@@ -51,3 +56,249 @@ def test_init_db_executes_create_table(patch_psycopg_connect):
     init_db()
     assert any('CREATE TABLE IF NOT EXISTS emails' in q for q, _ in dummy_cursor.queries)
     assert dummy_conn.closed
+
+def test_init_db_backfills_sender_columns(patch_psycopg_connect):
+    dummy_cursor, _ = patch_psycopg_connect
+    init_db()
+    queries = [q for q, _ in dummy_cursor.queries]
+    assert any('ADD COLUMN IF NOT EXISTS sender_email' in q for q in queries)
+    assert any('SELECT id, sender FROM emails' in q for q in queries)
+    assert any('idx_emails_sender_email' in q for q in queries)
+
+def test_backfill_sender_columns_matches_parse_sender(patch_psycopg_connect):
+    dummy_cursor, dummy_conn = patch_psycopg_connect
+
+    class BatchCursor(DummyCursor):
+        batches = [[(1, 'Jane <Jane@X.com>'), (2, 'addr@x.com (Name)')], [(7, 'undisclosed')]]
+        def fetchall(self):
+            return self.batches.pop(0) if self.batches else []
+
+    cursor = BatchCursor()
+    dummy_conn.cursor_obj = cursor
+    assert db_mod.backfill_sender_columns(batch_size=2) == 3
+    updates = [p for q, p in cursor.queries if 'UPDATE emails' in q]
+    assert updates[0] == ([1, 2], ['jane@x.com', 'addr@x.com'], ['x.com', 'x.com'])
+    assert updates[1] == ([7], ['undisclosed'], [None])
+    # Keyset pagination moves past rows that stay unparsed
+    assert [p[0] for q, p in cursor.queries if 'SELECT id, sender' in q] == [0, 2, 7]
+    assert 'INSERT INTO schema_migrations' in cursor.queries[-1][0]
+
+def test_backfill_sender_columns_runs_once(patch_psycopg_connect):
+    dummy_cursor, _ = patch_psycopg_connect
+    dummy_cursor.fetchone = lambda: (True,)  # schema_migrations records the backfill
+
+    assert db_mod.backfill_sender_columns() == 0
+    assert not any('SELECT id, sender' in q for q, _ in dummy_cursor.queries)
+
+def test_init_db_creates_label_dimension(patch_psycopg_connect):
+    dummy_cursor, _ = patch_psycopg_connect
+    init_db()
+    queries = [q for q, _ in dummy_cursor.queries]
+    assert any('CREATE TABLE IF NOT EXISTS labels' in q for q in queries)
+    assert any('USING GIN (label_ids)' in q for q in queries)
+
+def test_label_backfill_skips_display_names(patch_psycopg_connect):
+    import re
+    pattern = re.compile(db_mod.GMAIL_LABEL_ID_PATTERN)
+    assert all(pattern.match(l) for l in ['INBOX', 'Label_12', 'CATEGORY_PROMOTIONS', 'YELLOW_STAR'])
+    assert not any(pattern.match(l) for l in ['ArchiveMail', 'Label_x', 'inbox'])
+
+    dummy_cursor, _ = patch_psycopg_connect
+    init_db()
+    queries = [q for q, _ in dummy_cursor.queries]
+    assert any('INSERT INTO labels' in q and db_mod.GMAIL_LABEL_ID_PATTERN in q for q in queries)
+    assert any('DELETE FROM labels' in q and 'gmail_label_id = name' in q for q in queries)
+
+def test_one_time_migrations_skip_once_recorded(patch_psycopg_connect):
+    dummy_cursor, _ = patch_psycopg_connect
+    # schema_migrations already records every name
+    def fetchone():
+        query = dummy_cursor.queries[-1][0]
+        if 'INSERT INTO schema_migrations' in query:
+            return None
+        return (True,) if 'FROM schema_migrations' in query else (None,)
+    dummy_cursor.fetchone = fetchone
+    init_db()
+    queries = [q for q, _ in dummy_cursor.queries]
+    assert any('INSERT INTO schema_migrations' in q for q in queries)
+    assert not any('DELETE FROM labels' in q for q in queries)
+    assert not any('SELECT id, sender' in q for q in queries)
+
+def test_init_db_creates_action_queue(patch_psycopg_connect):
+    dummy_cursor, _ = patch_psycopg_connect
+    init_db()
+    queries = [q for q, _ in dummy_cursor.queries]
+    assert any('CREATE TABLE IF NOT EXISTS email_actions' in q for q in queries)
+
+class ScriptedCursor(DummyCursor):
+    """Answers catalog lookups made by the partition helpers."""
+    def __init__(self, partitioned=True, existing=(), children=(), default_months=()):
+        super().__init__()
+        self.partitioned = partitioned
+        self.existing = set(existing)
+        self.children = list(children)
+        self.default_months = list(default_months)
+        self._last = None
+    def execute(self, query, params=None):
+        super().execute(query, params)
+        self._last = (str(query), params)
+    def fetchone(self):
+        query, params = self._last
+        if 'pg_partitioned_table' in query:
+            return (1,) if self.partitioned else None
+        if 'to_regclass(%s)' in query:
+            return (params[0] if params[0] in self.existing else None,)
+        if 'FROM emails_default WHERE' in query:
+            return (1,) if params[0] in self.default_months else None
+        if 'FROM schema_migrations' in query:
+            return (False,)
+        return None
+    def fetchall(self):
+        if 'FROM emails_default' in self._last[0]:
+            return [(month,) for month in self.default_months]
+        return [(name,) for name in self.children]
+
+def _freeze_today(monkeypatch, day):
+    class FrozenDate(db_mod.datetime.date):
+        @classmethod
+        def today(cls):
+            return day
+    monkeypatch.setattr(db_mod.datetime, 'date', FrozenDate)
+
+def test_init_db_partitioned(monkeypatch, patch_psycopg_connect):
+    _, dummy_conn = patch_psycopg_connect
+    cursor = ScriptedCursor()
+    dummy_conn.cursor_obj = cursor
+    monkeypatch.setenv('EMAILS_PARTITIONED', 'true')
+    monkeypatch.setenv('EMAILS_PARTITION_MONTHS_BACK', '1')
+    monkeypatch.setenv('EMAILS_PARTITION_MONTHS_AHEAD', '1')
+    monkeypatch.delenv('EMAILS_RETENTION_MONTHS', raising=False)
+
+    init_db()
+    queries = [q for q, _ in cursor.queries]
+    assert any('PARTITION BY RANGE (date_received)' in q for q in queries)
+    assert any('PARTITION OF emails DEFAULT' in q for q in queries)
+    assert sum(1 for q in queries if not isinstance(q, str)) == 3
+
+def test_ensure_partitions_creates_missing_months(monkeypatch, patch_psycopg_connect):
+    _, dummy_conn = patch_psycopg_connect
+    dummy_conn.cursor_obj = ScriptedCursor(existing={'emails_p2025_01'})
+    _freeze_today(monkeypatch, db_mod.datetime.date(2025, 1, 15))
+
+    created = db_mod.ensure_partitions(months_back=1, months_ahead=1)
+    assert created == ['emails_p2024_12', 'emails_p2025_02']
+    bounds = [p for q, p in dummy_conn.cursor_obj.queries if not isinstance(q, str)]
+    assert bounds[0] == (db_mod.datetime.date(2024, 12, 1), db_mod.datetime.date(2025, 1, 1))
+
+def test_ensure_partitions_covers_backfill_range_and_splits_default(monkeypatch, patch_psycopg_connect):
+    _, dummy_conn = patch_psycopg_connect
+    date = db_mod.datetime.date
+    cursor = ScriptedCursor(default_months=[date(2020, 3, 1)])
+    dummy_conn.cursor_obj = cursor
+    _freeze_today(monkeypatch, date(2025, 1, 15))
+    monkeypatch.delenv('EMAILS_RETENTION_MONTHS', raising=False)
+
+    created = db_mod.ensure_partitions(months_back=0, months_ahead=0,
+                                       since=date(2024, 11, 20), until=date(2025, 1, 1))
+    assert created == ['emails_p2020_03', 'emails_p2024_11', 'emails_p2024_12', 'emails_p2025_01']
+    # The month held by emails_default is rebuilt and attached instead of created in place
+    composed = [repr(q) for q, _ in cursor.queries if not isinstance(q, str)]
+    assert sum('ATTACH PARTITION' in q for q in composed) == 1
+    assert sum('PARTITION OF emails FOR VALUES' in q for q in composed) == 3
+
+def test_ensure_partitions_stops_at_retention_cutoff(monkeypatch, patch_psycopg_connect):
+    _, dummy_conn = patch_psycopg_connect
+    dummy_conn.cursor_obj = ScriptedCursor()
+    _freeze_today(monkeypatch, db_mod.datetime.date(2025, 1, 15))
+    monkeypatch.setenv('EMAILS_RETENTION_MONTHS', '1')
+
+    assert db_mod.ensure_partitions(months_back=3, months_ahead=0) == ['emails_p2024_12', 'emails_p2025_01']
+
+def test_ensure_partitions_skips_unpartitioned_table(patch_psycopg_connect):
+    _, dummy_conn = patch_psycopg_connect
+    dummy_conn.cursor_obj = ScriptedCursor(partitioned=False)
+    assert db_mod.ensure_partitions(months_back=1, months_ahead=1) == []
+
+def test_apply_retention_detaches_old_partitions(monkeypatch, patch_psycopg_connect):
+    _, dummy_conn = patch_psycopg_connect
+    cursor = ScriptedCursor(children=['emails_default', 'emails_p2024_06', 'emails_p2024_07', 'emails_p2025_01'])
+    dummy_conn.cursor_obj = cursor
+    _freeze_today(monkeypatch, db_mod.datetime.date(2025, 1, 15))
+
+    removed = db_mod.apply_retention(6)
+    assert removed == ['emails_p2024_06']
+    # Only the DETACH statement is composed; archived partitions are kept
+    assert sum(1 for q, _ in cursor.queries if not isinstance(q, str)) == 1
+
+    cursor.queries.clear()
+    assert db_mod.apply_retention(6, drop=True) == ['emails_p2024_06']
+    assert sum(1 for q, _ in cursor.queries if not isinstance(q, str)) == 2
+
+def test_init_db_rejects_mismatched_layout(monkeypatch, patch_psycopg_connect):
+    _, dummy_conn = patch_psycopg_connect
+    cursor = ScriptedCursor(partitioned=False, existing={'emails'})
+    dummy_conn.cursor_obj = cursor
+    monkeypatch.setenv('EMAILS_PARTITIONED', 'true')
+
+    with pytest.raises(RuntimeError, match='not partitioned'):
+        init_db()
+    assert not any('PARTITION OF emails' in str(q) for q, _ in cursor.queries)
+
+def test_emails_partitioned_checks_flag_once(monkeypatch, patch_psycopg_connect):
+    _, dummy_conn = patch_psycopg_connect
+    cursor = ScriptedCursor(partitioned=True)
+    dummy_conn.cursor_obj = cursor
+    monkeypatch.setenv('EMAILS_PARTITIONED', 'false')
+    with pytest.raises(RuntimeError, match='is partitioned'):
+        db_mod.emails_partitioned()
+
+    monkeypatch.setenv('EMAILS_PARTITIONED', 'true')
+    assert db_mod.emails_partitioned() is True
+    cursor.queries.clear()
+    assert db_mod.emails_partitioned() is True
+    assert cursor.queries == []
+
+def test_init_db_holds_schema_lock(patch_psycopg_connect):
+    dummy_cursor, _ = patch_psycopg_connect
+    init_db()
+    queries = [q for q, _ in dummy_cursor.queries]
+    assert queries[0] == 'SELECT pg_advisory_lock(%s);'
+    assert dummy_cursor.queries[0][1] == (db_mod.SCHEMA_LOCK_KEY,)
+
+def test_apply_retention_survives_concurrent_detach(monkeypatch, patch_psycopg_connect):
+    _, dummy_conn = patch_psycopg_connect
+
+    class RacingCursor(ScriptedCursor):
+        def execute(self, query, params=None):
+            super().execute(query, params)
+            if not isinstance(query, str):
+                raise psycopg2.errors.UndefinedTable('already detached')
+
+    dummy_conn.cursor_obj = RacingCursor(children=['emails_p2024_05', 'emails_p2024_06'])
+    _freeze_today(monkeypatch, db_mod.datetime.date(2025, 1, 15))
+    assert db_mod.apply_retention(6) == []
+
+def test_check_mailbox_account_rejects_other_account(monkeypatch, patch_psycopg_connect):
+    _, dummy_conn = patch_psycopg_connect
+
+    class BoundCursor(DummyCursor):
+        def fetchone(self):
+            return ('alice',)
+
+    dummy_conn.cursor_obj = BoundCursor()
+    monkeypatch.setenv('ACCOUNT_ID', 'alice')
+    db_mod.check_mailbox_account()
+    monkeypatch.setenv('ACCOUNT_ID', 'bob')
+    with pytest.raises(RuntimeError, match="belongs to ACCOUNT_ID 'alice'"):
+        db_mod.check_mailbox_account()
+
+def test_init_db_sqlite_backend(monkeypatch, patch_psycopg_connect):
+    dummy_cursor, _ = patch_psycopg_connect
+    import db_client.sqlite_client as sqlite_mod
+    calls = []
+    monkeypatch.setattr(sqlite_mod, 'init_sqlite_db', lambda: calls.append(True))
+    monkeypatch.setenv('STORAGE_BACKEND', 'sqlite')
+
+    init_db()
+    assert calls == [True]
+    assert dummy_cursor.queries == []
@@ -1,6 +1,7 @@
 import pytest
 import data_handler.email_processor as ep_mod
-from mail_clients.process_email import fetch_and_store_emails
+import mail_clients.process_email as pe_mod
+from mail_clients.process_email import fetch_and_store_emails, reconcile_deleted_emails
 
 class FakeService:
     def __init__(self, messages_list, details_list):
@@ -14,7 +15,11 @@ class FakeService:
     def messages(self):
         return self
 
-    def list(self, userId, maxResults, pageToken):
+    def labels(self):
+        return FakeLabels()
+
+    def list(self, userId, maxResults, pageToken, q=None):
+        self.query = q
         if self._calls == 0:
             self._calls += 1
             return type('R', (), {
@@ -28,6 +33,12 @@ class FakeService:
         detail = next(d for d in self._details_list if d['id'] == id)
         return type('R', (), {'execute': lambda self=None, detail=detail: detail})()
 
+class FakeLabels:
+    def list(self, userId):
+        return type('R', (), {
+            'execute': lambda self=None: {'labels': [{'id': 'INBOX', 'name': 'INBOX'}]}
+        })()
+
 def test_fetch_and_store_emails(monkeypatch):
     msg_id = '1'
     messages_list = [{'id': msg_id}]
@@ -36,7 +47,7 @@ def test_fetch_and_store_emails(monkeypatch):
         'threadId': 't1',
         'payload': {'headers': [
             {'name': 'Subject', 'value': 'sub'},
-            {'name': 'From',    'value': 'sender'},
+            {'name': 'From',    'value': 'Sender <Sender@Mail.com>'},
             {'name': 'Date',    'value': 'Wed, 01 Jan 2020 00:00:00 +0000'}
         ]},
         'snippet': 'snippet',
@@ -46,6 +57,9 @@ def test_fetch_and_store_emails(monkeypatch):
     monkeypatch.setattr('mail_clients.process_email.get_gmail_service',
                         lambda: fake_service)
 
+    stored_labels = []
+    monkeypatch.setattr(ep_mod.EmailRepository, 'upsert_labels',
+                        lambda labels: stored_labels.extend(labels))
     calls = []
     monkeypatch.setattr(ep_mod.EmailRepository, 'insert_or_update_email',
                         lambda record: calls.append(record) or 'created')
@@ -56,5 +70,158 @@ def test_fetch_and_store_emails(monkeypatch):
     record = calls[0]
     assert record['gmail_id'] == msg_id
     assert record['subject']  == 'sub'
-    assert record['sender']   == 'sender'
+    assert record['sender']   == 'Sender <Sender@Mail.com>'
+    assert record['sender_email']  == 'sender@mail.com'
+    assert record['sender_domain'] == 'mail.com'
     assert record['messages'] == 'snippet'
+    assert stored_labels == [{'id': 'INBOX', 'name': 'INBOX'}]
+
+def test_fetch_and_store_emails_skips_mail_past_retention(monkeypatch):
+    import datetime
+    fake_service = FakeService([], [])
+    monkeypatch.setattr('mail_clients.process_email.get_gmail_service', lambda: fake_service)
+    monkeypatch.setattr(pe_mod, 'get_email_repository', lambda: ep_mod.EmailRepository)
+    monkeypatch.setattr(ep_mod.EmailRepository, 'upsert_labels', lambda labels: None)
+    monkeypatch.setattr(pe_mod, 'partitioning_enabled', lambda: True)
+    monkeypatch.setattr(pe_mod, 'retention_cutoff', lambda: datetime.date(2024, 7, 1))
+
+    fetch_and_store_emails()
+    assert fake_service.query == 'after:2024/07/01'
+
+class FakeIdService:
+    def __init__(self, pages):
+        self._pages = pages
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, userId, maxResults, pageToken, fields):
+        index = int(pageToken or 0)
+        page = {'messages': [{'id': i} for i in self._pages[index]]}
+        if index + 1 < len(self._pages):
+            page['nextPageToken'] = str(index + 1)
+        return type('R', (), {'execute': lambda self=None: page})()
+
+def test_reconcile_deleted_emails(monkeypatch):
+    fake_service = FakeIdService([['c', 'a'], ['e']])
+    monkeypatch.setattr('mail_clients.process_email.get_gmail_service',
+                        lambda: fake_service)
+    def iter_missing(listed_ids, include_deleted):
+        listed = set(listed_ids)
+        return (gmail_id for gmail_id in ['a', 'b', 'c', 'd', 'f'] if gmail_id not in listed)
+    monkeypatch.setattr(ep_mod.EmailRepository, 'iter_missing_gmail_ids', iter_missing)
+    batches = []
+    monkeypatch.setattr(ep_mod.EmailRepository, 'tombstone_emails',
+                        lambda ids, purge: batches.append(list(ids)) or len(ids))
+
+    assert reconcile_deleted_emails(batch_size=2) == 3
+    assert batches == [['b', 'd'], ['f']]
+
+def test_reconcile_deleted_emails_stops_when_lease_is_lost(monkeypatch):
+    import threading
+    monkeypatch.setattr('mail_clients.process_email.get_gmail_service',
+                        lambda: FakeIdService([['a']]))
+    monkeypatch.setattr(ep_mod.EmailRepository, 'iter_missing_gmail_ids',
+                        lambda listed_ids, include_deleted: iter(['b', 'c']))
+    monkeypatch.setattr(ep_mod.EmailRepository, 'tombstone_emails',
+                        lambda ids, purge: pytest.fail('lease was lost'))
+    stop = threading.Event()
+    stop.set()
+
+    assert reconcile_deleted_emails(batch_size=5, stop=stop) == 0
+
+class FakeSearchService:
+    def __init__(self, estimates=None, pages=None):
+        self._estimates = estimates or {}
+        self._pages = pages or []
+        self.queries = []
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, userId, q, maxResults, pageToken=None, fields=None):
+        self.queries.append(q)
+        if fields == 'resultSizeEstimate':
+            start = int(q.split()[0].split(':')[1])
+            page = {'resultSizeEstimate': self._estimates.get(start, 0)}
+        else:
+            index = int(pageToken or 0)
+            page = {'messages': [{'id': i} for i in self._pages[index]]}
+            if index + 1 < len(self._pages):
+                page['nextPageToken'] = str(index + 1)
+        return type('R', (), {'execute': lambda self=None: page})()
+
+def test_plan_backfill_windows_balances_estimates():
+    # Four 10s slices; most mail sits in the last one
+    service = FakeSearchService(estimates={0: 10, 10: 10, 20: 0, 30: 80})
+    windows = pe_mod._plan_backfill_windows(service, 0, 40, windows=4, samples=4)
+    assert windows == [(0, 30), (30, 40)]
+    assert service.queries[0] == 'after:0 before:10'
+
+    service = FakeSearchService(estimates={0: 25, 10: 25, 20: 25, 30: 25})
+    windows = pe_mod._plan_backfill_windows(service, 0, 40, windows=2, samples=4)
+    assert windows == [(0, 20), (20, 40)]
+
+def test_plan_backfill_windows_empty_mailbox():
+    windows = pe_mod._plan_backfill_windows(FakeSearchService(), 0, 40, windows=4, samples=4)
+    assert windows == [(0, 40)]
+
+def test_backfill_window_checkpoints_each_page(monkeypatch):
+    service = FakeSearchService(pages=[['a', 'b'], ['c']])
+    monkeypatch.setattr('mail_clients.process_email.get_gmail_service', lambda: service)
+    stored = []
+    monkeypatch.setattr(pe_mod, '_store_message',
+                        lambda svc, msg_id, repository: stored.append(msg_id) or 'created')
+    checkpoints = []
+    monkeypatch.setattr(pe_mod.BackfillCheckpointRepository, 'save_checkpoint',
+                        lambda *args: checkpoints.append(args))
+
+    window = {'window_start': 0, 'window_end': 40, 'page_token': None,
+              'processed': 0, 'status': 'pending'}
+    counts = pe_mod._backfill_window('run', window, page_size=2)
+    assert stored == ['a', 'b', 'c']
+    assert counts == {'processed': 3, 'new': 3, 'updated': 0}
+    assert checkpoints == [('run', 0, '1', 2, 'pending'), ('run', 0, None, 3, 'done')]
+
+def test_backfill_window_skips_done_window(monkeypatch):
+    monkeypatch.setattr('mail_clients.process_email.get_gmail_service',
+                        lambda: pytest.fail('should not connect'))
+    window = {'window_start': 0, 'window_end': 40, 'page_token': None,
+              'processed': 5, 'status': 'done'}
+    assert pe_mod._backfill_window('run', window, page_size=2)['processed'] == 0
+
+class FakeBackfillService(FakeSearchService):
+    def labels(self):
+        return FakeLabels()
+
+def _patch_backfill(monkeypatch, windows, created=True):
+    import datetime
+    monkeypatch.setattr(pe_mod, 'storage_backend', lambda: 'postgres')
+    monkeypatch.setattr(pe_mod, 'emails_partitioned', lambda: False)
+    monkeypatch.setattr(pe_mod, 'get_gmail_service', lambda: FakeBackfillService())
+    monkeypatch.setattr(ep_mod.EmailRepository, 'upsert_labels', lambda labels: None)
+    keys = []
+    monkeypatch.setattr(pe_mod.BackfillCheckpointRepository, 'get_windows',
+                        lambda run_key: keys.append(run_key) or list(windows))
+    monkeypatch.setattr(pe_mod.BackfillCheckpointRepository, 'create_windows',
+                        lambda run_key, planned: created)
+    return keys, datetime.date(2020, 1, 1)
+
+def test_backfill_emails_resumes_open_ended_run(monkeypatch):
+    done = {'window_start': 0, 'window_end': 40, 'page_token': None, 'processed': 5, 'status': 'done'}
+    keys, since = _patch_backfill(monkeypatch, [done])
+
+    assert pe_mod.backfill_emails(since)['processed'] == 0
+    assert keys == ['2020-01-01:open']
+
+def test_backfill_emails_fails_when_plan_not_saved(monkeypatch):
+    _, since = _patch_backfill(monkeypatch, [], created=False)
+    monkeypatch.setattr(pe_mod, '_backfill_window', lambda *args: pytest.fail('nothing to run'))
+
+    assert pe_mod.backfill_emails(since, windows=2, samples=2) is None
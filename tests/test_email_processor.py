@@ -39,6 +39,7 @@ def patch_db(monkeypatch):
     
     # Default get_connection returns an empty dummy
     monkeypatch.setattr(ep_mod, 'get_connection', lambda: DummyConnection(DummyCursor()))
+    monkeypatch.setattr(ep_mod, 'emails_partitioned', lambda: False)
 
 def test_has_email_changed_same():
     existing = {
@@ -47,7 +48,7 @@ def test_has_email_changed_same():
         'labels': ['a']
     }
     new = existing.copy()
-    assert not EmailRepository._has_email_changed(existing, new)
+    assert not ep_mod.has_email_changed(existing, new)
 
 def test_has_email_changed_diff():
     existing = {
@@ -57,7 +58,28 @@ def test_has_email_changed_diff():
     }
     new = existing.copy()
     new['subject'] = 'different'
-    assert EmailRepository._has_email_changed(existing, new)
+    assert ep_mod.has_email_changed(existing, new)
+
+def test_has_email_changed_tombstoned():
+    existing = {
+        'thread_id': 't', 'sender': 's', 'subject': 'sub',
+        'messages': 'm', 'date_received': 1, 'is_read': True,
+        'labels': ['a']
+    }
+    new = existing.copy()
+    existing['deleted_at'] = 1
+    assert ep_mod.has_email_changed(existing, new)
+
+def test_parse_rule_normalises_for_both_backends():
+    assert ep_mod.parse_rule({'field': 'From', 'predicate': 'Equals', 'value': 'Jane <Jane@X.com>'}) == \
+        ('sender_email', 'equals', 'jane@x.com')
+    assert ep_mod.parse_rule({'field': 'From Domain', 'predicate': 'Equals', 'value': '@X.com '}) == \
+        ('sender_domain', 'equals', 'x.com')
+    assert ep_mod.parse_rule({'field': 'Received Date', 'predicate': 'Less than', 'value': '3 days'}) == \
+        ('date_received', 'less than', 3)
+    assert ep_mod.parse_rule({'field': 'Label', 'predicate': 'Has', 'value': 'INBOX'}) == ('labels', 'has', 'INBOX')
+    assert ep_mod.parse_rule({'field': 'Label', 'predicate': 'Contains', 'value': 'x'}) is None
+    assert ep_mod.parse_rule({'field': 'Cc', 'predicate': 'Equals', 'value': 'x'}) is None
 
 def test_insert_or_update_email_created(monkeypatch):
     # No existing record
@@ -80,8 +102,7 @@ def test_insert_or_update_email_updated(monkeypatch):
                         lambda x: {'gmail_id': 'id', 'thread_id': 'a', 'sender': 's',
                                    'subject': 'sub', 'messages': 'm',
                                    'date_received': 1, 'is_read': True, 'labels': ['a']})
-    monkeypatch.setattr(EmailRepository, '_has_email_changed',
-                        staticmethod(lambda a, b: True))
+    monkeypatch.setattr(ep_mod, 'has_email_changed', lambda a, b: True)
     dummy_cursor = DummyCursor(rows=[(False,)])
     dummy_conn = DummyConnection(dummy_cursor)
     monkeypatch.setattr(ep_mod, 'get_connection', lambda: dummy_conn)
@@ -100,8 +121,7 @@ def test_insert_or_update_email_unchanged(monkeypatch):
         'date_received': 1, 'is_read': True, 'labels': ['a']
     }
     monkeypatch.setattr(EmailRepository, 'get_email_by_gmail_id', lambda x: existing)
-    monkeypatch.setattr(EmailRepository, '_has_email_changed',
-                        staticmethod(lambda a, b: False))
+    monkeypatch.setattr(ep_mod, 'has_email_changed', lambda a, b: False)
 
     record = existing.copy()
     assert EmailRepository.insert_or_update_email(record) == 'unchanged'
@@ -152,6 +172,19 @@ def test_update_email(monkeypatch):
     })
     assert dummy_conn.closed
 
+def test_set_read_and_add_label_write_only_their_columns(monkeypatch):
+    dummy_cursor = DummyCursor()
+    dummy_conn = DummyConnection(dummy_cursor)
+    monkeypatch.setattr(ep_mod, 'get_connection', lambda: dummy_conn)
+
+    EmailRepository.set_read('id', True)
+    EmailRepository.add_label('id', 'Label_1')
+    (read_query, read_params), (label_query, label_params) = dummy_cursor.queries
+    assert "array_remove(emails.labels, 'UNREAD')" in read_query
+    assert read_params == {'is_read': True, 'gmail_id': 'id'}
+    assert 'is_read' not in label_query and 'array_append(labels' in label_query
+    assert label_params == ('Label_1', 'Label_1', 'id', 'Label_1')
+
 def test_get_emails_by_conditions_contains(monkeypatch):
     rules = [{'field': 'From', 'predicate': 'Contains', 'value': 'test'}]
     desc = [('gmail_id',),('sender',)]
@@ -162,3 +195,106 @@ def test_get_emails_by_conditions_contains(monkeypatch):
 
     result = EmailRepository.get_emails_by_conditions(rules, 'All')
     assert result[0]['gmail_id'] == 'id1'
+
+def test_parse_sender():
+    assert ep_mod.parse_sender('Jane Doe <Jane@Example.COM>') == ('jane@example.com', 'example.com')
+    assert ep_mod.parse_sender('plain@x.org') == ('plain@x.org', 'x.org')
+    assert ep_mod.parse_sender(None) == (None, None)
+
+def test_get_emails_by_conditions_equals_uses_sender_email(monkeypatch):
+    rules = [
+        {'field': 'From', 'predicate': 'Equals', 'value': 'Jane <Jane@Example.com>'},
+        {'field': 'From Domain', 'predicate': 'Equals', 'value': '@Example.com'},
+    ]
+    dummy_cursor = DummyCursor(rows=[], description=[('gmail_id',)])
+    monkeypatch.setattr(ep_mod, 'get_connection', lambda: DummyConnection(dummy_cursor))
+
+    EmailRepository.get_emails_by_conditions(rules, 'All')
+    query, params = dummy_cursor.queries[0]
+    assert 'sender_email = %s' in query
+    assert 'sender_domain = %s' in query
+    assert 'ILIKE' not in query
+    assert params == ['jane@example.com', 'example.com']
+
+def test_get_emails_by_conditions_label(monkeypatch):
+    rules = [
+        {'field': 'Label', 'predicate': 'Has', 'value': 'INBOX'},
+        {'field': 'Label', 'predicate': 'Does not have', 'value': 'ArchiveMail'},
+    ]
+    label_ids = {'INBOX': [1], 'ArchiveMail': [7, 9]}
+    monkeypatch.setattr(EmailRepository, 'get_label_ids', lambda label: label_ids[label])
+    dummy_cursor = DummyCursor(rows=[], description=[('gmail_id',)])
+    monkeypatch.setattr(ep_mod, 'get_connection', lambda: DummyConnection(dummy_cursor))
+
+    EmailRepository.get_emails_by_conditions(rules, 'All')
+    query, params = dummy_cursor.queries[0]
+    assert "label_ids && %s::integer[] AND NOT (COALESCE(label_ids, '{}') && %s::integer[])" in query
+    assert params == [[1], [7, 9]]
+
+def test_upsert_labels(monkeypatch):
+    dummy_cursor = DummyCursor()
+    dummy_conn = DummyConnection(dummy_cursor)
+    monkeypatch.setattr(ep_mod, 'get_connection', lambda: dummy_conn)
+
+    EmailRepository.upsert_labels([{'id': 'Label_1', 'name': 'ArchiveMail'}])
+    query, params = dummy_cursor.queries[0]
+    assert 'INSERT INTO labels' in query
+    assert params == (['Label_1'], ['ArchiveMail'])
+    assert dummy_conn.closed
+
+def test_get_emails_by_conditions_skips_deleted(monkeypatch):
+    rules = [{'field': 'Subject', 'predicate': 'Contains', 'value': 'x'}]
+    dummy_cursor = DummyCursor(rows=[], description=[('gmail_id',)])
+    monkeypatch.setattr(ep_mod, 'get_connection', lambda: DummyConnection(dummy_cursor))
+
+    EmailRepository.get_emails_by_conditions(rules, 'Any')
+    assert 'WHERE deleted_at IS NULL AND (subject ILIKE %s)' in dummy_cursor.queries[0][0]
+
+def test_tombstone_emails(monkeypatch):
+    dummy_cursor = DummyCursor()
+    dummy_cursor.rowcount = 2
+    monkeypatch.setattr(ep_mod, 'get_connection', lambda: DummyConnection(dummy_cursor))
+
+    assert EmailRepository.tombstone_emails(['a', 'b']) == 2
+    assert 'SET deleted_at = NOW()' in dummy_cursor.queries[0][0]
+    assert EmailRepository.tombstone_emails(['a'], purge=True) == 2
+    assert 'DELETE FROM emails' in dummy_cursor.queries[1][0]
+
+def test_get_emails_by_conditions_received_date_prunable(monkeypatch):
+    rules = [{'field': 'Received Date', 'predicate': 'Greater than', 'value': '30 days'}]
+    dummy_cursor = DummyCursor(rows=[], description=[('gmail_id',)])
+    monkeypatch.setattr(ep_mod, 'get_connection', lambda: DummyConnection(dummy_cursor))
+
+    EmailRepository.get_emails_by_conditions(rules, 'All')
+    query, params = dummy_cursor.queries[0]
+    assert 'date_received < NOW() - INTERVAL %s' in query
+    assert params == ['30 DAYS']
+
+def test_insert_or_update_email_partitioned_conflict_target(monkeypatch):
+    monkeypatch.setattr(EmailRepository, 'get_email_by_gmail_id', lambda x: None)
+    monkeypatch.setattr(ep_mod, 'emails_partitioned', lambda: True)
+    dummy_cursor = DummyCursor(rows=[(True,)])
+    monkeypatch.setattr(ep_mod, 'get_connection', lambda: DummyConnection(dummy_cursor))
+
+    EmailRepository.insert_or_update_email({'gmail_id': 'id'})
+    assert 'ON CONFLICT (gmail_id, date_received)' in dummy_cursor.queries[0][0]
+
+def test_iter_missing_gmail_ids_stages_listing(monkeypatch):
+    class CopyCursor(DummyCursor):
+        copies = []
+        def copy_expert(self, sql, file):
+            self.copies.append(file.read())
+        def __iter__(self):
+            return iter(self._rows)
+    class NamedConnection(DummyConnection):
+        def cursor(self, name=None):
+            return self.cursor_obj
+    dummy_cursor = CopyCursor(rows=[('b',)])
+    monkeypatch.setattr(ep_mod, 'get_connection', lambda: NamedConnection(dummy_cursor))
+
+    missing = EmailRepository.iter_missing_gmail_ids(iter(['a', 'c', 'd']), batch_size=2)
+    assert list(missing) == ['b']
+    assert CopyCursor.copies == ['a\nc\n', 'd\n']
+    queries = [q for q, _ in dummy_cursor.queries]
+    assert 'CREATE TEMP TABLE gmail_listing' in queries[0]
+    assert 'NOT EXISTS' in queries[-1] and 'deleted_at IS NULL' in queries[-1]
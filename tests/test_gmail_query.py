@@ -0,0 +1,26 @@
+import pytest
+from mail_clients.gmail_query import build_gmail_query
+
+def test_build_gmail_query_all():
+    rules = [
+        {'field': 'From', 'predicate': 'Contains', 'value': 'alerts@example.com'},
+        {'field': 'Subject', 'predicate': 'Does not Contain', 'value': 'Weekly digest'},
+        {'field': 'Received Date', 'predicate': 'Less than', 'value': '7 days'},
+    ]
+    assert build_gmail_query(rules, 'All') == \
+        'from:alerts@example.com -subject:"Weekly digest" newer_than:7d'
+
+def test_build_gmail_query_any():
+    rules = [
+        {'field': 'Received Date/Time', 'predicate': 'Greater than', 'value': '30 days'},
+        {'field': 'Label', 'predicate': 'Has', 'value': 'ArchiveMail'},
+    ]
+    assert build_gmail_query(rules, 'Any') == '{older_than:30d label:ArchiveMail}'
+
+def test_build_gmail_query_rejects_untranslatable_rules():
+    rules = [
+        {'field': 'From', 'predicate': 'Contains', 'value': 'x'},
+        {'field': 'Subject', 'predicate': 'Equals', 'value': 'Exact subject'},
+    ]
+    with pytest.raises(ValueError, match='Subject Equals Exact subject'):
+        build_gmail_query(rules, 'All')
@@ -0,0 +1,80 @@
+import time
+import pytest
+import data_handler.lease as lease_mod
+from data_handler.lease import LeaseRepository, hold_lease
+
+class DummyCursor:
+    def __init__(self, rows=None, rowcount=0):
+        self._rows = rows or []
+        self.rowcount = rowcount
+        self.queries = []
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+class DummyConnection:
+    def __init__(self, cursor):
+        self.cursor_obj = cursor
+        self.closed = False
+    def cursor(self):
+        return self.cursor_obj
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        pass
+    def close(self):
+        self.closed = True
+
+def test_acquire_takes_over_expired_leases_only(monkeypatch):
+    dummy_cursor = DummyCursor(rows=[('me',)])
+    dummy_conn = DummyConnection(dummy_cursor)
+    monkeypatch.setattr(lease_mod, 'get_connection', lambda: dummy_conn)
+
+    assert LeaseRepository.acquire('acct', 'sync', 'me', 60)
+    query, params = dummy_cursor.queries[0]
+    assert 'WHERE run_leases.expires_at < NOW() OR run_leases.holder = EXCLUDED.holder' in query
+    assert params == ('acct', 'sync', 'me', 60)
+    assert dummy_conn.closed
+
+def test_acquire_fails_while_held(monkeypatch):
+    monkeypatch.setattr(lease_mod, 'get_connection', lambda: DummyConnection(DummyCursor()))
+    assert not LeaseRepository.acquire('acct', 'sync', 'me', 60)
+
+def test_heartbeat_reports_lost_lease(monkeypatch):
+    monkeypatch.setattr(lease_mod, 'get_connection', lambda: DummyConnection(DummyCursor(rowcount=0)))
+    assert not LeaseRepository.heartbeat('acct', 'sync', 'me', 60)
+
+def test_hold_lease_heartbeats_and_releases(monkeypatch):
+    events = []
+    monkeypatch.setattr(LeaseRepository, 'acquire', lambda *args: events.append('acquire') or True)
+    monkeypatch.setattr(LeaseRepository, 'heartbeat', lambda *args: events.append('heartbeat') or True)
+    monkeypatch.setattr(LeaseRepository, 'release', lambda *args: events.append('release'))
+
+    with hold_lease('acct', 'sync', ttl_seconds=0.03) as acquired:
+        assert acquired
+        deadline = time.monotonic() + 2
+        while 'heartbeat' not in events and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert 'heartbeat' in events
+    assert events[0] == 'acquire' and events[-1] == 'release'
+
+def test_hold_lease_yields_none_when_held(monkeypatch):
+    monkeypatch.setattr(LeaseRepository, 'acquire', lambda *args: False)
+    monkeypatch.setattr(LeaseRepository, 'release', lambda *args: pytest.fail('not ours to release'))
+
+    with hold_lease('acct', 'sync') as lost:
+        assert lost is None
+
+def test_hold_lease_signals_lost_lease(monkeypatch):
+    monkeypatch.setattr(LeaseRepository, 'acquire', lambda *args: True)
+    monkeypatch.setattr(LeaseRepository, 'heartbeat', lambda *args: False)
+    monkeypatch.setattr(LeaseRepository, 'release', lambda *args: None)
+
+    with hold_lease('acct', 'sync', ttl_seconds=0.03) as lost:
+        assert not lost.is_set()
+        assert lost.wait(2)
@@ -3,6 +3,7 @@ import json
 import pytest
 import process_rules as pr_mod
 import data_handler.email_processor as ep_mod
+import data_handler.action_queue as aq_mod
 
 
 class FakeService:
@@ -48,8 +49,44 @@ def patch_env_and_repo(tmp_path, monkeypatch):
     # Stub out DB lookup
     monkeypatch.setattr(ep_mod.EmailRepository, 'get_emails_by_conditions',
                         lambda rules, pred: [{'gmail_id': '1', 'is_read': False, 'labels': []}])
+    monkeypatch.setattr(ep_mod.EmailRepository, 'upsert_labels', lambda labels: None)
 
-def test_apply_rules_triggers_actions(monkeypatch):
+class FakeQueue:
+    def __init__(self):
+        self.enqueued = []
+        self.pending  = []
+        self.done     = []
+        self.failed   = []
+
+    def enqueue_actions(self, gmail_ids, actions):
+        for gmail_id in gmail_ids:
+            for action in actions:
+                job_id = len(self.enqueued) + 1
+                self.enqueued.append((gmail_id, action))
+                self.pending.append({'id': job_id, 'gmail_id': gmail_id,
+                                     'action': action, 'attempts': 1})
+        return len(self.enqueued)
+
+    def claim_batch(self, batch_size, max_attempts):
+        batch, self.pending = self.pending[:batch_size], self.pending[batch_size:]
+        return batch
+
+    def mark_done(self, action_ids):
+        self.done.extend(action_ids)
+
+    def mark_failed(self, action_id, error, max_attempts):
+        self.failed.append((action_id, error))
+
+@pytest.fixture
+def fake_queue(monkeypatch):
+    queue = FakeQueue()
+    for name in ('enqueue_actions', 'claim_batch', 'mark_done', 'mark_failed'):
+        monkeypatch.setattr(aq_mod.ActionQueueRepository, name, getattr(queue, name))
+    monkeypatch.setattr(ep_mod.EmailRepository, 'get_email_by_gmail_id',
+                        lambda gmail_id: {'gmail_id': gmail_id, 'is_read': False, 'labels': []})
+    return queue
+
+def test_apply_rules_triggers_actions(monkeypatch, fake_queue):
     fake_service = FakeService()
     monkeypatch.setattr('process_rules.get_gmail_service', lambda: fake_service)
 
@@ -58,24 +95,153 @@ def test_apply_rules_triggers_actions(monkeypatch):
                         lambda service, email, action: calls.append((email, action)))
 
     pr_mod.apply_rules()
+    assert fake_queue.enqueued == [('1', 'Mark as read')]
     assert calls == [({'gmail_id': '1', 'is_read': False, 'labels': []}, 'Mark as read')]
+    assert fake_queue.done == [1]
+
+def test_apply_rules_drains_with_env_settings(monkeypatch, fake_queue):
+    calls = []
+    monkeypatch.setattr('process_rules.drain_action_queue', lambda **kwargs: calls.append(kwargs))
+    monkeypatch.setenv('ACTION_WORKER_BATCH_SIZE', '7')
+    monkeypatch.setenv('ACTION_MAX_ATTEMPTS', '2')
+
+    pr_mod.apply_rules()
+    assert calls == [{'batch_size': 7, 'max_attempts': 2, 'stop': None}]
+
+def test_apply_rules_enqueue_only(monkeypatch, fake_queue):
+    calls = []
+    monkeypatch.setattr('process_rules.perform_action',
+                        lambda service, email, action: calls.append((email, action)))
+
+    pr_mod.apply_rules(enqueue_only=True)
+    assert fake_queue.enqueued == [('1', 'Mark as read')]
+    assert calls == []
+
+def test_drain_action_queue_marks_failures(monkeypatch, fake_queue):
+    fake_queue.enqueue_actions(['1', '2'], ['Mark as read'])
+
+    def flaky(service, email, action):
+        if email['gmail_id'] == '2':
+            raise RuntimeError('quota exceeded')
+    monkeypatch.setattr('process_rules.perform_action', flaky)
+
+    assert pr_mod.drain_action_queue(service=FakeService(), batch_size=1) == 1
+    assert fake_queue.done == [1]
+    assert fake_queue.failed == [(2, 'quota exceeded')]
+
+def test_drain_action_queue_stops_when_lease_is_lost(fake_queue):
+    import threading
+    fake_queue.enqueue_actions(['1'], ['Mark as read'])
+    stop = threading.Event()
+    stop.set()
+
+    assert pr_mod.drain_action_queue(service=FakeService(), stop=stop) == 0
+    assert len(fake_queue.pending) == 1
 
 def test_perform_action_mark_as_read(monkeypatch):
     
     fake_service = FakeService()
-    email = {'gmail_id': '1', 'is_read': False, 'labels': []}
-    monkeypatch.setattr(ep_mod.EmailRepository, 'update_email', lambda record: None)
+    email = {'gmail_id': '1', 'is_read': False, 'labels': ['INBOX', 'UNREAD']}
+    writes = []
+    monkeypatch.setattr(ep_mod.EmailRepository, 'set_read',
+                        lambda gmail_id, is_read: writes.append((gmail_id, is_read)))
 
     pr_mod.perform_action(fake_service, email, 'Mark as read')
-    assert email['is_read']
+    assert email['is_read'] and email['labels'] == ['INBOX']
+    assert writes == [('1', True)]
+
+    pr_mod.perform_action(fake_service, email, 'Mark as unread')
+    assert not email['is_read'] and email['labels'] == ['INBOX', 'UNREAD']
+    assert writes == [('1', True), ('1', False)]
     assert fake_service.modified[0][1] == {'removeLabelIds': ['UNREAD']}
 
 def test_perform_action_move_to_label(monkeypatch):
     fake_service = FakeService()
     fake_service.labels_list = []  # force label creation
-    monkeypatch.setattr(ep_mod.EmailRepository, 'update_email', lambda record: None)
+    writes = []
+    monkeypatch.setattr(ep_mod.EmailRepository, 'upsert_labels', lambda labels: None)
+    monkeypatch.setattr(ep_mod.EmailRepository, 'add_label',
+                        lambda gmail_id, label_id: writes.append((gmail_id, label_id)))
 
     email = {'gmail_id': '1', 'is_read': True, 'labels': []}
     pr_mod.perform_action(fake_service, email, 'Move Message : Inbox')
-    assert 'Inbox' in email['labels']
+    assert email['labels'] == ['newid']
+    assert writes == [('1', 'newid')]
     assert any('addLabelIds' in body for _, body in fake_service.modified)
+
+class FakeSearchService(FakeService):
+    def __init__(self, matches):
+        super().__init__()
+        self.matches = matches
+        self.queries = []
+
+    def list(self, userId, q=None, maxResults=None, pageToken=None):
+        if q is None:
+            return super().list(userId)
+        self.queries.append(q)
+        page = {'messages': [{'id': i} for i in self.matches]}
+        return type('R', (), {'execute': lambda self=None: page})()
+
+    def get(self, userId, id, format):
+        return type('R', (), {'execute': lambda self=None: {'id': id, 'labelIds': ['UNREAD']}})()
+
+def test_apply_rules_on_gmail(monkeypatch):
+    fake_service = FakeSearchService(['a', 'b'])
+    monkeypatch.setattr('process_rules.get_gmail_service', lambda: fake_service)
+    monkeypatch.setattr(aq_mod.ActionQueueRepository, 'enqueue_actions',
+                        lambda *args: pytest.fail('should not use the local table'))
+    calls = []
+    monkeypatch.setattr('process_rules.perform_action',
+                        lambda service, email, action, write_back: calls.append(
+                            (email['gmail_id'], email['is_read'], action, write_back)))
+
+    pr_mod.apply_rules(on_gmail=True)
+    assert fake_service.queries == ['from:test']
+    assert calls == [('a', False, 'Mark as read', False), ('b', False, 'Mark as read', False)]
+
+def test_apply_rules_on_gmail_needs_no_database(monkeypatch):
+    fake_service = FakeSearchService(['a', 'b'])
+    monkeypatch.setattr('process_rules.get_gmail_service', lambda: fake_service)
+    monkeypatch.setattr(ep_mod.EmailRepository, 'set_read',
+                        lambda *args: pytest.fail('no database in Gmail mode'))
+    monkeypatch.setattr(ep_mod.EmailRepository, 'add_label',
+                        lambda *args: pytest.fail('no database in Gmail mode'))
+    monkeypatch.setattr(ep_mod.EmailRepository, 'upsert_labels',
+                        lambda labels: pytest.fail('no database in Gmail mode'))
+    rules = [{'field': 'Label', 'predicate': 'Does not have', 'value': 'Inbox'}]
+
+    assert pr_mod.apply_rules_on_gmail(rules, 'All', ['Mark as read', 'Move Message: Inbox']) == 2
+    assert [message_id for message_id, _ in fake_service.modified] == ['a', 'a', 'b', 'b']
+
+def test_apply_rules_on_gmail_rejects_untranslatable(monkeypatch):
+    monkeypatch.setattr('process_rules.get_gmail_service', lambda: pytest.fail('should not connect'))
+    rules = [{'field': 'Subject', 'predicate': 'Equals', 'value': 'x'}]
+    assert pr_mod.apply_rules_on_gmail(rules, 'All', ['Mark as read']) == 0
+
+def test_apply_rules_sqlite_backend_acts_inline(monkeypatch):
+    monkeypatch.setattr('process_rules.storage_backend', lambda: 'sqlite')
+    monkeypatch.setattr('process_rules.get_email_repository', lambda: ep_mod.EmailRepository)
+    monkeypatch.setattr('process_rules.get_gmail_service', lambda: FakeService())
+    monkeypatch.setattr(aq_mod.ActionQueueRepository, 'enqueue_actions',
+                        lambda *args: pytest.fail('outbox is postgres-only'))
+    calls = []
+    monkeypatch.setattr('process_rules.perform_action',
+                        lambda service, email, action: calls.append((email['gmail_id'], action)))
+
+    pr_mod.apply_rules()
+    assert calls == [('1', 'Mark as read')]
+
+def test_apply_rules_dry_run(monkeypatch):
+    monkeypatch.setattr(aq_mod.ActionQueueRepository, 'enqueue_actions',
+                        lambda *args: pytest.fail('dry run must not enqueue'))
+    monkeypatch.setattr('process_rules.get_gmail_service', lambda: pytest.fail('dry run must not connect'))
+
+    pr_mod.apply_rules(dry_run=True)
+
+def test_apply_rules_gmail_dry_run_reports_untranslatable(tmp_path, monkeypatch):
+    rf = tmp_path / 'subject_equals.json'
+    rf.write_text(json.dumps({'rules': [{'field': 'Subject', 'predicate': 'Equals', 'value': 'x'}],
+                              'actions': ['Mark as read']}))
+    monkeypatch.setattr('process_rules.get_gmail_service', lambda: pytest.fail('dry run must not connect'))
+
+    pr_mod.apply_rules(on_gmail=True, dry_run=True, rules_file=str(rf))
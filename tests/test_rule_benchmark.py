@@ -0,0 +1,63 @@
+import json
+import benchmarks.rule_benchmark as rb_mod
+from benchmarks.rule_benchmark import run_benchmarks, rule_files, format_summary, DEFAULT_CATALOG
+
+PLAN = [{'Plan': {'Node Type': 'Bitmap Heap Scan',
+                  'Plans': [{'Node Type': 'Bitmap Index Scan'}]},
+         'Execution Time': 0.42}]
+
+class DummyCursor:
+    def __init__(self):
+        self.queries = []
+        self._last = None
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+        self._last = query
+    def fetchall(self):
+        return [('a',), ('b',)]
+    def fetchone(self):
+        return (PLAN,)
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+class DummyConnection:
+    def __init__(self, cursor):
+        self.cursor_obj = cursor
+        self.closed = False
+    def cursor(self):
+        return self.cursor_obj
+    def rollback(self):
+        pass
+    def close(self):
+        self.closed = True
+
+class FakeRepository:
+    @staticmethod
+    def build_conditions_query(rules, predicate):
+        return "SELECT * FROM emails WHERE sender_email = %s;", ['x@y.com']
+
+def test_catalog_files_are_valid_rules():
+    files = rule_files(DEFAULT_CATALOG)
+    assert len(files) >= 5
+    for path in files:
+        with open(path) as f:
+            data = json.load(f)
+        assert data['rules'] and data['predicate'] in ('All', 'Any')
+
+def test_run_benchmarks_records_latency_and_plan(tmp_path, monkeypatch):
+    rules_file = tmp_path / 'from_equals.json'
+    rules_file.write_text(json.dumps({'predicate': 'All', 'rules': [
+        {'field': 'From', 'predicate': 'Equals', 'value': 'x@y.com'}]}))
+    dummy_cursor = DummyCursor()
+    monkeypatch.setattr(rb_mod, 'get_connection', lambda: DummyConnection(dummy_cursor))
+    monkeypatch.setattr(rb_mod, 'get_email_repository', lambda: FakeRepository)
+
+    [result] = run_benchmarks(str(tmp_path), repeat=3)
+    assert result['name'] == 'from_equals'
+    assert result['rows'] == 2 and result['runs'] == 3
+    assert result['plan_nodes'] == ['Bitmap Heap Scan', 'Bitmap Index Scan']
+    assert result['seq_scan'] is False
+    assert dummy_cursor.queries[-1][0].startswith('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT')
+    assert 'from_equals' in format_summary([result])
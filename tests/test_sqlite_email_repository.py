@@ -0,0 +1,149 @@
+import datetime
+import threading
+import pytest
+import db_client.sqlite_client as sqlite_mod
+from db_client.sqlite_client import init_sqlite_db, get_sqlite_connection
+from data_handler.sqlite_email_repository import SqliteEmailRepository
+
+@pytest.fixture(autouse=True)
+def sqlite_db(tmp_path, monkeypatch):
+    monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'emails.db'))
+    monkeypatch.setattr(sqlite_mod, '_local', threading.local())
+    init_sqlite_db()
+    yield
+    get_sqlite_connection().close()
+
+def _record(gmail_id, **overrides):
+    record = {
+        'gmail_id': gmail_id, 'thread_id': 't', 'sender': 'Jane <jane@example.com>',
+        'sender_email': 'jane@example.com', 'sender_domain': 'example.com',
+        'subject': 'Weekly Support digest', 'messages': 'snippet',
+        'date_received': datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=2),
+        'is_read': False, 'labels': ['INBOX', 'UNREAD'],
+    }
+    record.update(overrides)
+    return record
+
+def _ids(emails):
+    return sorted(e['gmail_id'] for e in emails)
+
+def test_sqlite_uses_wal():
+    assert get_sqlite_connection().execute('PRAGMA journal_mode;').fetchone()[0] == 'wal'
+
+def test_insert_or_update_email_roundtrip():
+    record = _record('a')
+    assert SqliteEmailRepository.insert_or_update_email(record) == 'created'
+    assert SqliteEmailRepository.insert_or_update_email(dict(record)) == 'unchanged'
+    assert SqliteEmailRepository.insert_or_update_email(_record('a', subject='new')) == 'updated'
+
+    stored = SqliteEmailRepository.get_email_by_gmail_id('a')
+    assert stored['subject'] == 'new'
+    assert stored['labels'] == ['INBOX', 'UNREAD']
+    assert stored['is_read'] is False
+
+def test_transaction_batches_writes():
+    with SqliteEmailRepository.transaction():
+        SqliteEmailRepository.insert_or_update_email(_record('a'))
+        SqliteEmailRepository.insert_or_update_email(_record('b'))
+        assert get_sqlite_connection().in_transaction
+    assert not get_sqlite_connection().in_transaction
+    assert len(SqliteEmailRepository.get_all_emails()) == 2
+
+def test_get_emails_by_conditions_contains_uses_fts():
+    SqliteEmailRepository.insert_or_update_email(_record('a'))
+    SqliteEmailRepository.insert_or_update_email(_record('b', subject='Invoice'))
+
+    rules = [{'field': 'Subject', 'predicate': 'Contains', 'value': 'support'}]
+    assert _ids(SqliteEmailRepository.get_emails_by_conditions(rules, 'All')) == ['a']
+    rules = [{'field': 'Subject', 'predicate': 'Does not Contain', 'value': 'support'}]
+    assert _ids(SqliteEmailRepository.get_emails_by_conditions(rules, 'All')) == ['b']
+
+    plan = get_sqlite_connection().execute(
+        "EXPLAIN QUERY PLAN SELECT rowid FROM emails_fts WHERE emails_fts MATCH 'subject : \"support\"'"
+    ).fetchall()
+    assert any('VIRTUAL TABLE INDEX' in row[-1] for row in plan)
+
+def test_get_emails_by_conditions_equals_date_and_label():
+    SqliteEmailRepository.upsert_labels([{'id': 'INBOX', 'name': 'INBOX'},
+                                         {'id': 'Label_1', 'name': 'ArchiveMail'}])
+    SqliteEmailRepository.insert_or_update_email(_record('a'))
+    old = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=90)
+    SqliteEmailRepository.insert_or_update_email(
+        _record('b', sender_email='bob@other.org', sender_domain='other.org',
+                date_received=old, labels=['Label_1']))
+
+    rules = [{'field': 'From', 'predicate': 'Equals', 'value': 'JANE <Jane@Example.com>'}]
+    assert _ids(SqliteEmailRepository.get_emails_by_conditions(rules, 'All')) == ['a']
+    rules = [{'field': 'Received Date', 'predicate': 'Greater than', 'value': '30 days'}]
+    assert _ids(SqliteEmailRepository.get_emails_by_conditions(rules, 'All')) == ['b']
+    rules = [{'field': 'Label', 'predicate': 'Has', 'value': 'archivemail'},
+             {'field': 'From Domain', 'predicate': 'Equals', 'value': 'example.com'}]
+    assert _ids(SqliteEmailRepository.get_emails_by_conditions(rules, 'Any')) == ['a', 'b']
+    rules = [{'field': 'Label', 'predicate': 'Does not have', 'value': 'INBOX'}]
+    assert _ids(SqliteEmailRepository.get_emails_by_conditions(rules, 'All')) == ['b']
+
+def test_set_read_and_add_label_keep_each_other():
+    SqliteEmailRepository.upsert_labels([{'id': 'Label_1', 'name': 'ArchiveMail'},
+                                         {'id': 'UNREAD', 'name': 'UNREAD'}])
+    SqliteEmailRepository.insert_or_update_email(_record('a'))
+    unread = [{'field': 'Label', 'predicate': 'Has', 'value': 'UNREAD'}]
+
+    SqliteEmailRepository.add_label('a', 'Label_1')
+    SqliteEmailRepository.add_label('a', 'Label_1')
+    SqliteEmailRepository.set_read('a', True)
+    email = SqliteEmailRepository.get_email_by_gmail_id('a')
+    assert email['is_read'] and email['labels'] == ['INBOX', 'Label_1']
+    rules = [{'field': 'Label', 'predicate': 'Has', 'value': 'ArchiveMail'}]
+    assert _ids(SqliteEmailRepository.get_emails_by_conditions(rules, 'All')) == ['a']
+    assert SqliteEmailRepository.get_emails_by_conditions(unread, 'All') == []
+
+    SqliteEmailRepository.set_read('a', False)
+    assert SqliteEmailRepository.get_email_by_gmail_id('a')['labels'] == ['INBOX', 'Label_1', 'UNREAD']
+    assert _ids(SqliteEmailRepository.get_emails_by_conditions(unread, 'All')) == ['a']
+
+def test_update_email_and_tombstones():
+    SqliteEmailRepository.upsert_labels([{'id': 'Label_1', 'name': 'ArchiveMail'}])
+    SqliteEmailRepository.insert_or_update_email(_record('a'))
+    SqliteEmailRepository.insert_or_update_email(_record('b'))
+
+    SqliteEmailRepository.update_email({'gmail_id': 'a', 'is_read': True, 'labels': ['Label_1']})
+    rules = [{'field': 'Label', 'predicate': 'Has', 'value': 'ArchiveMail'}]
+    assert _ids(SqliteEmailRepository.get_emails_by_conditions(rules, 'All')) == ['a']
+
+    assert list(SqliteEmailRepository.iter_missing_gmail_ids([])) == ['a', 'b']
+    assert SqliteEmailRepository.tombstone_emails(['a']) == 1
+    assert list(SqliteEmailRepository.iter_missing_gmail_ids([])) == ['b']
+    assert SqliteEmailRepository.get_emails_by_conditions(rules, 'All') == []
+    assert SqliteEmailRepository.tombstone_emails(['a'], purge=True) == 1
+    assert list(SqliteEmailRepository.iter_missing_gmail_ids([], include_deleted=True)) == ['b']
+
+def test_resynced_identical_record_revives_tombstone():
+    SqliteEmailRepository.insert_or_update_email(_record('a'))
+    SqliteEmailRepository.tombstone_emails(['a'])
+    assert SqliteEmailRepository.insert_or_update_email(_record('a')) == 'updated'
+    assert SqliteEmailRepository.get_email_by_gmail_id('a')['deleted_at'] is None
+    assert list(SqliteEmailRepository.iter_missing_gmail_ids([])) == ['a']
+
+def test_iter_missing_gmail_ids_anti_joins_listing():
+    for gmail_id in ['a', 'b', 'c']:
+        SqliteEmailRepository.insert_or_update_email(_record(gmail_id))
+    SqliteEmailRepository.tombstone_emails(['c'])
+
+    missing = SqliteEmailRepository.iter_missing_gmail_ids(iter(['a', 'x', 'a']), batch_size=1)
+    assert list(missing) == ['b']
+    assert sorted(SqliteEmailRepository.iter_missing_gmail_ids(['a'], include_deleted=True)) == ['b', 'c']
+
+    def failing_listing():
+        yield 'a'
+        raise RuntimeError('listing failed')
+    with pytest.raises(RuntimeError):
+        next(SqliteEmailRepository.iter_missing_gmail_ids(failing_listing()))
+
+def test_get_email_repository_follows_storage_backend(monkeypatch):
+    from data_handler.repository import get_email_repository
+    from data_handler.email_processor import EmailRepository
+
+    monkeypatch.setenv('STORAGE_BACKEND', 'sqlite')
+    assert get_email_repository() is SqliteEmailRepository
+    monkeypatch.setenv('STORAGE_BACKEND', 'postgres')
+    assert get_email_repository() is EmailRepository
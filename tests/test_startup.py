@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy dependencies that must only load once a subcommand actually needs them
+HEAVY_MODULES = ('googleapiclient', 'google_auth_oauthlib', 'google.auth', 'psycopg2')
+
+
+def _imported_modules(*args):
+    """Run python -X importtime with args and return the names of imported modules."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            name = line.rsplit('|', 1)[1].strip()
+            if name != 'imported package':
+                modules.append(name)
+    return modules
+
+
+@pytest.mark.parametrize('args', [
+    ['cli.py', '--help'],
+    ['cli.py', 'sync', '--help'],
+    ['cli.py', 'apply-rules', '--help'],
+    ['-c', 'import process_rules, mail_clients.process_email, db_client.db_client'],
+])
+def test_startup_skips_heavy_imports(args):
+    modules = _imported_modules(*args)
+    assert modules, 'importtime produced no output'
+    heavy = [m for m in modules if m.startswith(HEAVY_MODULES)]
+    assert heavy == []
@@ -0,0 +1,71 @@
+import collections
+import csv
+import io
+import benchmarks.synthetic_emails as se_mod
+from benchmarks.synthetic_emails import generate_rows, load_synthetic_emails, COPY_COLUMNS
+
+class DummyCursor:
+    def __init__(self):
+        self.queries = []
+        self.copies = []
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+    def fetchall(self):
+        return [(label_id, i + 1) for i, (label_id, _, _) in enumerate(se_mod.LABEL_SHARES)]
+    def copy_expert(self, sql, buffer):
+        self.copies.append((sql, buffer.getvalue()))
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+class DummyConnection:
+    def __init__(self, cursor):
+        self.cursor_obj = cursor
+        self.closed = False
+    def cursor(self):
+        return self.cursor_obj
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, tb):
+        pass
+    def close(self):
+        self.closed = True
+
+def test_generate_rows_is_deterministic_and_unique():
+    rows = list(generate_rows(2000, seed=3))
+    assert rows == list(generate_rows(2000, seed=3))
+    assert len({r[0] for r in rows}) == 2000
+    assert all(len(r) == len(COPY_COLUMNS) - 1 for r in rows)
+
+def test_generate_rows_run_id_only_changes_ids():
+    plain = list(generate_rows(50, seed=3))
+    tagged = list(generate_rows(50, seed=3, run_id='abc12345'))
+    assert all(r[0].startswith('abc12345') and r[1].startswith('abc12345') for r in tagged)
+    assert [r[2:] for r in tagged] == [r[2:] for r in plain]
+    assert not {r[0] for r in plain} & {r[0] for r in tagged}
+
+def test_generate_rows_skews_senders():
+    rows = list(generate_rows(5000, seed=1))
+    senders = collections.Counter(r[3] for r in rows)
+    # The top sender gets far more than a uniform share of 1/5000
+    assert senders.most_common(1)[0] == ('noreply0@acme0.com', senders['noreply0@acme0.com'])
+    assert senders['noreply0@acme0.com'] > 250
+    for row in rows[:50]:
+        assert row[3].endswith('@' + row[4])
+        assert row[8] == ('UNREAD' not in row[9])
+
+def test_load_synthetic_emails_copies_in_batches(monkeypatch):
+    dummy_cursor = DummyCursor()
+    dummy_conn = DummyConnection(dummy_cursor)
+    monkeypatch.setattr(se_mod, 'get_connection', lambda: dummy_conn)
+    monkeypatch.setattr(se_mod, 'emails_partitioned', lambda: False)
+
+    assert load_synthetic_emails(25, seed=2, batch_size=10) == 25
+    assert len(dummy_cursor.copies) == 3
+    sql, data = dummy_cursor.copies[0]
+    assert sql.startswith('COPY emails (gmail_id,')
+    first = next(csv.reader(io.StringIO(data)))
+    assert first[-2].startswith('{') and first[-1].startswith('{')
+    assert any('ANALYZE emails' in q for q, _ in dummy_cursor.queries)
+    assert dummy_conn.closed